@@ -1,14 +1,16 @@
 """项目启动入口：
 
 1. 创建 CookieManager，按配置文件 / 环境变量初始化账号任务
-2. 在后台线程启动 FastAPI (reply_server) 提供管理与自动回复接口
+2. 在主事件循环内启动 FastAPI (reply_server) 提供管理与自动回复接口
 3. 主协程保持运行
 """
 
 import os
 import sys
+import mmap
+import contextlib
+import signal
 import asyncio
-import threading
 import uvicorn
 from urllib.parse import urlparse
 from pathlib import Path
@@ -23,6 +25,20 @@ if sys.platform.startswith('linux'):
     except Exception as e:
         logger.debug(f"设置事件循环策略失败: {e}")
 
+# 非Windows环境优先使用uvloop，网络密集型场景下事件循环调度更快
+_UVLOOP_AVAILABLE = False
+if sys.platform != 'win32':
+    try:
+        import uvloop
+        uvloop.install()
+        _UVLOOP_AVAILABLE = True
+        logger.debug("已启用 uvloop 事件循环")
+    except ImportError:
+        logger.debug("uvloop 未安装，使用默认事件循环")
+
+# 启动配置只在进程启动时读取一次，固化环境变量快照避免重复查询 os.environ
+_ENV = os.environ.copy()
+
 from config import AUTO_REPLY, COOKIES_LIST
 import cookie_manager as cm
 from db_manager import db_manager
@@ -32,102 +48,173 @@ from usage_statistics import report_user_count
 # 新增：CookieCloud 支持
 # 注意：此文件位于 replace/Start.py，替换后对应 import 为 utils.cookiecloud
 try:
-    from utils.cookiecloud import fetch_cookiecloud_cookie_str
+    from utils.cookiecloud import fetch_cookiecloud_cookie_str, aclose_session as _aclose_cookiecloud_session
 except Exception:
     # 在未替换前的运行环境下，避免导入错误导致崩溃
     fetch_cookiecloud_cookie_str = None
+    _aclose_cookiecloud_session = None
     logger.warning("utils.cookiecloud 未就绪，CookieCloud 同步将被跳过")
 
 
-def _start_api_server():
-    """后台线程启动 FastAPI 服务"""
-    api_conf = AUTO_REPLY.get('api', {})
+def _resolve_api_endpoint(api_conf: dict = None):
+    """解析 API 服务监听地址，返回 (host, port)
 
-    # 优先使用环境变量配置
-    host = os.getenv('API_HOST', '0.0.0.0')  # 默认绑定所有接口
-    port = int(os.getenv('API_PORT', '8080'))  # 默认端口8080
-
-    # 如果配置文件中有特定配置，则使用配置文件
-    if 'host' in api_conf:
-        host = api_conf['host']
-    if 'port' in api_conf:
-        port = api_conf['port']
-
-    # 兼容旧的URL配置方式
-    if 'url' in api_conf and 'host' not in api_conf and 'port' not in api_conf:
-        url = api_conf.get('url', 'http://0.0.0.0:8080/xianyu/reply')
-        parsed = urlparse(url)
+    优先级：配置文件 host/port > 配置文件 url > 环境变量 > 默认值。
+    只在确实配置了旧式 url 时才执行 urlparse。
+    """
+    if api_conf is None:
+        api_conf = AUTO_REPLY.get('api', {})
+
+    # 环境变量 / 默认值兜底
+    host = _ENV.get('API_HOST', '0.0.0.0')  # 默认绑定所有接口
+    port = int(_ENV.get('API_PORT', '8080'))  # 默认端口8080
+
+    if 'host' in api_conf or 'port' in api_conf:
+        # 配置文件中有特定配置，则使用配置文件
+        host = api_conf.get('host', host)
+        port = api_conf.get('port', port)
+    elif 'url' in api_conf:
+        # 兼容旧的URL配置方式
+        parsed = urlparse(api_conf['url'])
         if parsed.hostname and parsed.hostname != 'localhost':
             host = parsed.hostname
         port = parsed.port or 8080
 
+    return host, port
+
+
+class _NoSignalServer(uvicorn.Server):
+    """不接管进程信号的 uvicorn Server
+
+    serve() 首次运行时会用 signal.signal 覆盖 main() 已注册的
+    SIGTERM/SIGINT 处理器，导致 stop_event 永远不触发、账号任务
+    不被取消。这里把新旧两个注册入口都旁路掉，信号统一交给
+    main() 的优雅退出路径。
+    """
+
+    def install_signal_handlers(self) -> None:  # 旧版 uvicorn 入口
+        pass
+
+    @contextlib.contextmanager
+    def capture_signals(self):  # 新版 uvicorn 入口
+        yield
+
+
+def _start_api_server(host: str, port: int):
+    """在主事件循环内启动 FastAPI 服务（共享 uvloop，无需独立线程）
+
+    返回 (server, task)：调用方需持有 task 引用（asyncio 对任务只留
+    弱引用），退出时置 server.should_exit 并等待 task 收尾。
+    """
     logger.info(f"启动Web服务器: http://{host}:{port}")
-    uvicorn.run("reply_server:app", host=host, port=port, log_level="info")
+    config = uvicorn.Config(
+        "reply_server:app",
+        host=host,
+        port=port,
+        log_level="info",
+        loop="uvloop" if _UVLOOP_AVAILABLE else "auto",
+        lifespan="on",
+    )
+    server = _NoSignalServer(config)
+    return server, asyncio.create_task(server.serve())
+
+
+# 关键字与回复的分隔符，按优先级尝试：制表符 > 空格 > 冒号
+# （冒号仅在整行无制表符 / 空格时才作分隔符，URL 等正文原样保留）
+_KW_SEPS = ('\t', ' ', ':')
+
+
+# 超过该大小的关键字文件走 mmap 读取，避免整段缓冲拷贝
+_KW_MMAP_THRESHOLD = 64 * 1024
 
 
 def load_keywords_file(path: str):
     """从文件读取关键字 -> [(keyword, reply)]"""
     kw_list = []
     p = Path(path)
-    if not p.exists():
+    try:
+        size = p.stat().st_size
+    except OSError:
         return kw_list
-    with p.open('r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            if '\t' in line:
-                k, r = line.split('\t', 1)
-            elif ' ' in line:
-                k, r = line.split(' ', 1)
-            elif ':' in line:
-                k, r = line.split(':', 1)
-            else:
-                continue
-            kw_list.append((k.strip(), r.strip()))
+
+    def _iter_lines():
+        if size >= _KW_MMAP_THRESHOLD:
+            # 大文件：内存映射后逐行流式读取，不整段复制映射内容，
+            # 注释行在字节层跳过，仅对有效行做一次UTF-8解码
+            with p.open('rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for raw in iter(mm.readline, b''):
+                    if raw.lstrip()[:1] == b'#':
+                        continue
+                    yield raw.decode('utf-8')
+        else:
+            yield from p.read_text(encoding='utf-8').splitlines()
+
+    append = kw_list.append
+    for line in _iter_lines():
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        for sep in _KW_SEPS:
+            k, found, r = line.partition(sep)
+            if found:
+                append((k.strip(), r.strip()))
+                break
     return kw_list
 
 
-async def _cookiecloud_refresh_loop(manager: "cm.CookieManager",
-                                    cookie_id: str,
-                                    host: str,
-                                    uuid: str,
-                                    password: str,
-                                    refresh_seconds: int):
+def _apply_cookiecloud_result(manager: "cm.CookieManager", cookie_id: str, cookies_str: str):
+    """将一次 CookieCloud 拉取结果覆盖到指定账号"""
+    logger.info(f"CookieCloud 刷新成功，准备覆盖账号 {cookie_id} 的 Cookie")
+    # 如任务已启动，用更新接口热重启；否则只更新数据库与内存，后续由启动流程接管
+    if cookie_id in manager.tasks:
+        manager.update_cookie(cookie_id, cookies_str)
+    else:
+        # 未启动阶段：仅覆盖内存与数据库
+        try:
+            details = db_manager.get_cookie_details(cookie_id)
+            user_id = details.get('user_id') if details else None
+        except Exception:
+            user_id = None
+        with db_manager.atomic():
+            db_manager.save_cookie(cookie_id, cookies_str, user_id)
+        manager.cookies[cookie_id] = cookies_str
+        logger.info(f"已覆盖数据库与内存中的 Cookie（未启动阶段）: {cookie_id}")
+
+
+async def _cookiecloud_refresh_dispatcher(manager: "cm.CookieManager",
+                                          targets: list,
+                                          refresh_seconds: int):
     """
-    后台定时从 CookieCloud 拉取并覆盖指定账号 Cookie。
-    - 若拉取失败则跳过该轮，保留现有 Cookie。
+    后台定时从 CookieCloud 拉取并覆盖账号 Cookie。
+    所有目标账号共用一个定时器，每轮并发拉取，避免为每个账号常驻一个协程。
+    - 若某账号拉取失败则跳过该轮，保留现有 Cookie。
     - 若成功，则调用 manager.update_cookie 以热重启该账号任务。
+
+    targets: [(cookie_id, host, uuid, password), ...]
     """
     if not fetch_cookiecloud_cookie_str:
         logger.warning("CookieCloud 模块不可用，停止刷新循环")
         return
 
     refresh_seconds = max(60, int(refresh_seconds or 1800))  # 最小 60 秒
-    logger.info(f"CookieCloud 刷新任务已启动：账号={cookie_id}，间隔={refresh_seconds}s")
+    logger.info(f"CookieCloud 刷新任务已启动：账号={[t[0] for t in targets]}，间隔={refresh_seconds}s")
 
     while True:
         try:
             await asyncio.sleep(refresh_seconds)
-            cookies_str = await fetch_cookiecloud_cookie_str(host, uuid, password, timeout=20)
-            if not cookies_str:
-                logger.warning("CookieCloud 刷新失败，本轮跳过")
-                continue
-
-            logger.info(f"CookieCloud 刷新成功，准备覆盖账号 {cookie_id} 的 Cookie")
-            # 如任务已启动，用更新接口热重启；否则只更新数据库与内存，后续由启动流程接管
-            if cookie_id in getattr(manager, "tasks", {}):
-                manager.update_cookie(cookie_id, cookies_str)
-            else:
-                # 未启动阶段：仅覆盖内存与数据库
-                try:
-                    details = db_manager.get_cookie_details(cookie_id)
-                    user_id = details.get('user_id') if details else None
-                except Exception:
-                    user_id = None
-                db_manager.save_cookie(cookie_id, cookies_str, user_id)
-                manager.cookies[cookie_id] = cookies_str
-                logger.info(f"已覆盖数据库与内存中的 Cookie（未启动阶段）: {cookie_id}")
+            results = await asyncio.gather(
+                *[fetch_cookiecloud_cookie_str(host, uuid, password, timeout=20)
+                  for _, host, uuid, password in targets],
+                return_exceptions=True,
+            )
+            for (cookie_id, _, _, _), cookies_str in zip(targets, results):
+                if isinstance(cookies_str, Exception):
+                    logger.error(f"CookieCloud 刷新异常: 账号={cookie_id}, {cookies_str}")
+                    continue
+                if not cookies_str:
+                    logger.warning(f"CookieCloud 刷新失败，本轮跳过: {cookie_id}")
+                    continue
+                _apply_cookiecloud_result(manager, cookie_id, cookies_str)
         except asyncio.CancelledError:
             logger.info("CookieCloud 刷新任务已取消")
             break
@@ -135,23 +222,25 @@ async def _cookiecloud_refresh_loop(manager: "cm.CookieManager",
             logger.error(f"CookieCloud 周期刷新异常: {e}")
 
 
-async def _setup_cookiecloud_before_start(manager: "cm.CookieManager"):
+async def _setup_cookiecloud_before_start(manager: "cm.CookieManager",
+                                          details_map: dict = None):
     """
     若配置了环境变量（COOKIE_CLOUD_HOST/UUID/PASSWORD），
     则在启动任务前拉取 Cookie 并覆盖指定账号（默认优先覆盖 'default' 或唯一账号）。
     之后按 COOKIE_CLOUD_REFRESH_SECONDS 开启后台刷新。
     未配置时，不做任何改动，沿用原有 Cookie。
+    details_map 为启动时加载的 Cookie 详细信息快照，命中时可免去数据库查询。
     """
     if not fetch_cookiecloud_cookie_str:
         logger.info("未提供 CookieCloud 模块，跳过云端同步")
         return
 
-    host = (os.getenv("COOKIE_CLOUD_HOST") or "").strip()
-    uuid = (os.getenv("COOKIE_CLOUD_UUID") or "").strip()
-    password = (os.getenv("COOKIE_CLOUD_PASSWORD") or "").strip()
-    refresh_seconds = os.getenv("COOKIE_CLOUD_REFRESH_SECONDS") or os.getenv("COOKIE_CLOUD_REFRESH_INTERVAL") or "1800"
-    cookie_id_env = (os.getenv("COOKIE_CLOUD_COOKIE_ID") or "").strip()
-    refresh_on_token_failure_only = os.getenv("COOKIE_REFRESH_ON_TOKEN_FAILURE_ONLY", "true").lower() in ("true", "1", "t")
+    host = (_ENV.get("COOKIE_CLOUD_HOST") or "").strip()
+    uuid = (_ENV.get("COOKIE_CLOUD_UUID") or "").strip()
+    password = (_ENV.get("COOKIE_CLOUD_PASSWORD") or "").strip()
+    refresh_seconds = _ENV.get("COOKIE_CLOUD_REFRESH_SECONDS") or _ENV.get("COOKIE_CLOUD_REFRESH_INTERVAL") or "1800"
+    cookie_id_env = (_ENV.get("COOKIE_CLOUD_COOKIE_ID") or "").strip()
+    refresh_on_token_failure_only = _ENV.get("COOKIE_REFRESH_ON_TOKEN_FAILURE_ONLY", "true").lower() in ("true", "1", "t")
  
     # 未配置 CookieCloud，跳过
     if not host or not uuid:
@@ -177,6 +266,15 @@ async def _setup_cookiecloud_before_start(manager: "cm.CookieManager"):
         # 多账号场景且未指定，默认采用 default（不存在则创建）
         target_cookie_id = "default"
 
+    # 仅在 Token 刷新失败时更新的模式下，本地已有 Cookie 就不做首次拉取，
+    # 省掉启动路径上的一次网络往返；无本地 Cookie 时仍强制拉取一次
+    if refresh_on_token_failure_only:
+        has_local = (target_cookie_id in (details_map or {})
+                     or bool(db_manager.get_cookie(target_cookie_id)))
+        if has_local:
+            logger.info("已配置为仅在 Token 刷新失败时更新 Cookie，跳过启动时的 CookieCloud 拉取")
+            return
+
     # 首次拉取
     cookies_str = await fetch_cookiecloud_cookie_str(host, uuid, password, timeout=20)
     if not cookies_str:
@@ -185,12 +283,15 @@ async def _setup_cookiecloud_before_start(manager: "cm.CookieManager"):
 
     # 覆盖数据库与内存中的 Cookie，暂不启动任务（交由后续统一启动逻辑）
     try:
-        details = db_manager.get_cookie_details(target_cookie_id)
+        details = (details_map or {}).get(target_cookie_id)
+        if details is None:
+            details = db_manager.get_cookie_details(target_cookie_id)
         user_id = details.get('user_id') if details else None
     except Exception:
         user_id = None
 
-    db_manager.save_cookie(target_cookie_id, cookies_str, user_id)
+    with db_manager.atomic():
+        db_manager.save_cookie(target_cookie_id, cookies_str, user_id)
     manager.cookies[target_cookie_id] = cookies_str
 
     logger.info(f"CookieCloud 首次同步完成，已覆盖账号 {target_cookie_id} 的 Cookie，长度={len(cookies_str)}")
@@ -199,7 +300,7 @@ async def _setup_cookiecloud_before_start(manager: "cm.CookieManager"):
     # 启动后台刷新任务
     if refresh_seconds > 0 and not refresh_on_token_failure_only:
         asyncio.create_task(
-            _cookiecloud_refresh_loop(manager, target_cookie_id, host, uuid, password, refresh_seconds)
+            _cookiecloud_refresh_dispatcher(manager, [(target_cookie_id, host, uuid, password)], refresh_seconds)
         )
     elif refresh_on_token_failure_only:
         logger.info("已配置为仅在 Token 刷新失败时更新 Cookie，后台定时刷新已禁用")
@@ -221,37 +322,40 @@ async def main():
     manager = cm.manager
     print("CookieManager 创建完成")
 
+    # 启动时加载一次 Cookie 详细信息快照，供 CookieCloud 同步与任务启动共用
+    details_map = db_manager.get_all_cookie_details()
+
     # 在启动任务前：若环境已配置 CookieCloud，则拉取并覆盖 Cookie（否则保留原逻辑）
     try:
-        await _setup_cookiecloud_before_start(manager)
+        await _setup_cookiecloud_before_start(manager, details_map)
     except Exception as e:
         logger.error(f"启动前 CookieCloud 同步失败：{e}，将沿用本地 Cookie")
 
     # 1) 从数据库加载的 Cookie 已经在 CookieManager 初始化时完成
-    # 为每个启用的 Cookie 启动任务
-    for cid, val in manager.cookies.items():
-        # 检查账号是否启用
-        if not manager.get_cookie_status(cid):
-            logger.info(f"跳过禁用的 Cookie: {cid}")
-            continue
-
+    # 为每个启用的 Cookie 启动任务（详细信息一次性批量查询，避免逐个访问数据库）
+    enabled_ids = [cid for cid in manager.cookies if manager.get_cookie_status(cid)]
+    disabled_ids = [cid for cid in manager.cookies if cid not in enabled_ids]
+    if disabled_ids:
+        logger.info(f"跳过 {len(disabled_ids)} 个禁用的 Cookie: {disabled_ids}")
+    # 快照未覆盖的账号（极少见）再单独补查
+    missing_ids = [cid for cid in enabled_ids if cid not in details_map]
+    if missing_ids:
+        details_map.update(db_manager.get_cookie_details_bulk(missing_ids))
+
+    started_ids = []
+    create_task = loop.create_task
+    for cid in enabled_ids:
         try:
-            # 直接启动任务，不重新保存到数据库
-            from db_manager import db_manager
-            logger.info(f"正在获取Cookie详细信息: {cid}")
-            cookie_info = db_manager.get_cookie_details(cid)
+            # 直接启动任务，不重新保存到数据库；日志留到循环后统一输出
+            cookie_info = details_map.get(cid)
             user_id = cookie_info.get('user_id') if cookie_info else None
-            logger.info(f"Cookie详细信息获取成功: {cid}, user_id: {user_id}")
-
-            logger.info(f"正在创建异步任务: {cid}")
-            task = loop.create_task(manager._run_xianyu(cid, val, user_id))
-            manager.tasks[cid] = task
-            logger.info(f"启动数据库中的 Cookie 任务: {cid} (用户ID: {user_id})")
-            logger.info(f"任务已添加到管理器，当前任务数: {len(manager.tasks)}")
+            manager.tasks[cid] = create_task(manager._run_xianyu(cid, manager.cookies[cid], user_id))
+            started_ids.append(cid)
         except Exception as e:
             logger.error(f"启动 Cookie 任务失败: {cid}, {e}")
             import traceback
             logger.error(f"详细错误信息: {traceback.format_exc()}")
+    logger.info(f"启动 {len(started_ids)} 个 Cookie 任务: {started_ids}")
 
     # 2) 如果配置文件中有新的 Cookie，也加载它们
     for entry in COOKIES_LIST:
@@ -266,25 +370,64 @@ async def main():
         logger.info(f"从配置文件加载 Cookie: {cid}")
 
     # 3) 若老环境变量仍提供单账号 Cookie，则作为 default 账号
-    env_cookie = os.getenv('COOKIES_STR')
+    env_cookie = _ENV.get('COOKIES_STR')
     if env_cookie and 'default' not in manager.list_cookies():
         manager.add_cookie('default', env_cookie)
         logger.info("从环境变量加载 default Cookie")
 
-    # 启动 API 服务线程
-    print("启动 API 服务线程...")
-    threading.Thread(target=_start_api_server, daemon=True).start()
-    print("API 服务线程已启动")
+    # 在主循环内启动 API 服务
+    print("启动 API 服务...")
+    host, port = _resolve_api_endpoint()
+    api_server, api_task = _start_api_server(host, port)
+    print("API 服务已启动")
 
-    # 上报用户统计
-    try:
-        await report_user_count()
-    except Exception as e:
-        logger.debug(f"上报用户统计失败: {e}")
+    # 上报用户统计（后台执行，不阻塞启动路径）
+    def _log_report_result(task: asyncio.Task):
+        try:
+            task.result()
+        except Exception as e:
+            logger.debug(f"上报用户统计失败: {e}")
+
+    asyncio.create_task(
+        asyncio.wait_for(report_user_count(), timeout=5.0)
+    ).add_done_callback(_log_report_result)
 
-    # 阻塞保持运行
+    # 保持运行，直到收到退出信号
     print("主程序启动完成，保持运行...")
-    await asyncio.Event().wait()
+    stop_event = asyncio.Event()
+    if sys.platform != 'win32':
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except (NotImplementedError, RuntimeError) as e:
+                logger.debug(f"注册信号处理器失败: {sig}, {e}")
+    await stop_event.wait()
+
+    # 收到退出信号后，取消所有账号任务并等待其清理完成
+    logger.info("收到退出信号，正在停止所有 Cookie 任务...")
+    tasks = list(manager.tasks.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # 释放 CookieCloud 的共享 HTTP 会话，避免退出时报 Unclosed client session
+    if _aclose_cookiecloud_session is not None:
+        try:
+            await _aclose_cookiecloud_session()
+        except Exception as e:
+            logger.debug(f"关闭 CookieCloud 会话失败: {e}")
+
+    # 再优雅关闭 API 服务（走 lifespan shutdown），超时则强制取消
+    logger.info("正在关闭 API 服务...")
+    api_server.should_exit = True
+    try:
+        await asyncio.wait_for(api_task, timeout=10)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        api_task.cancel()
+    except Exception as e:
+        logger.debug(f"API 服务退出异常: {e}")
+    logger.info("所有任务已停止，主程序退出")
 
 
 if __name__ == '__main__':
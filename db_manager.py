@@ -9,6 +9,7 @@ import string
 import aiohttp
 import io
 import base64
+from contextlib import contextmanager
 from PIL import Image, ImageDraw, ImageFont
 from typing import List, Tuple, Dict, Optional, Any
 from loguru import logger
@@ -49,6 +50,7 @@ class DBManager:
         logger.info(f"数据库路径: {self.db_path}")
         self.conn = None
         self.lock = threading.RLock()  # 使用可重入锁保护数据库操作
+        self._atomic_depth = 0  # 处于 atomic() 批量事务中时 > 0，由 self.lock 保护
 
         # SQL日志配置 - 默认启用
         self.sql_log_enabled = True  # 默认启用SQL日志
@@ -352,7 +354,7 @@ class DBManager:
             # 添加 reply_once 字段（如果不存在）
             try:
                 cursor.execute('ALTER TABLE default_replies ADD COLUMN reply_once BOOLEAN DEFAULT FALSE')
-                self.conn.commit()
+                self._commit()
                 logger.info("已添加 reply_once 字段到 default_replies 表")
             except sqlite3.OperationalError as e:
                 if "duplicate column name" not in str(e).lower():
@@ -473,11 +475,11 @@ class DBManager:
             # 执行数据库迁移
             self._migrate_database(cursor)
 
-            self.conn.commit()
+            self._commit()
             logger.info("数据库初始化完成")
         except Exception as e:
             logger.error(f"数据库初始化失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             raise
 
     def _migrate_database(self, cursor):
@@ -748,7 +750,7 @@ class DBManager:
                 # 由于SQLite不支持直接修改约束，我们需要重建表
                 self._migrate_keywords_table_constraints(cursor)
 
-            self.conn.commit()
+            self._commit()
             logger.info(f"admin用户ID更新完成")
         except Exception as e:
             logger.error(f"更新admin用户ID失败: {e}")
@@ -1135,6 +1137,48 @@ class DBManager:
             self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         return self.conn
 
+    @contextmanager
+    def atomic(self):
+        """把多个写操作放进同一个事务，整体只落盘一次
+
+        用法::
+
+            with db_manager.atomic():
+                db_manager.save_cookie(...)
+                ...  # 其他相关写入
+
+        内部使用 BEGIN IMMEDIATE 提前拿写锁，异常时整体回滚。
+        锁为可重入锁，事务内可继续调用其他db方法；各写方法通过
+        _commit()/_rollback() 提交，处于 atomic 中时它们不各自
+        提交/回滚，由这里统一收尾，批量才真正只落盘一次。
+        """
+        with self.lock:
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                # 已处于事务中（嵌套调用），直接透传
+                yield
+                return
+            self._atomic_depth += 1
+            try:
+                yield
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            finally:
+                self._atomic_depth -= 1
+
+    def _commit(self):
+        """提交当前事务；在 atomic() 批量事务内时交由 atomic 统一提交"""
+        if not self._atomic_depth:
+            self.conn.commit()
+
+    def _rollback(self):
+        """回滚当前事务；在 atomic() 内为空操作，不动批量里已完成的写入"""
+        if not self._atomic_depth:
+            self.conn.rollback()
+
     def _log_sql(self, sql: str, params: tuple = None, operation: str = "EXECUTE"):
         """记录SQL执行日志"""
         if not self.sql_log_enabled:
@@ -1206,7 +1250,7 @@ class DBManager:
                     (cookie_id, cookie_value, user_id)
                 )
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"Cookie保存成功: {cookie_id} (用户ID: {user_id})")
 
                 # 验证保存结果
@@ -1219,7 +1263,7 @@ class DBManager:
                 return True
             except Exception as e:
                 logger.error(f"Cookie保存失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     
@@ -1232,12 +1276,12 @@ class DBManager:
                 self._execute_sql(cursor, "DELETE FROM keywords WHERE cookie_id = ?", (cookie_id,))
                 # 删除Cookie
                 self._execute_sql(cursor, "DELETE FROM cookies WHERE id = ?", (cookie_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"Cookie删除成功: {cookie_id}")
                 return True
             except Exception as e:
                 logger.error(f"Cookie删除失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
     
     def get_cookie(self, cookie_id: str) -> Optional[str]:
@@ -1319,13 +1363,60 @@ class DBManager:
                 logger.error(f"获取Cookie详细信息失败: {e}")
                 return None
 
+    def get_cookie_details_bulk(self, cookie_ids: List[str]) -> Dict[str, Dict[str, any]]:
+        """批量获取多个Cookie的详细信息，一次查询代替逐个查询
+
+        Args:
+            cookie_ids: Cookie ID列表
+
+        Returns:
+            Dict以cookie_id为键，值与get_cookie_details返回结构一致
+        """
+        if not cookie_ids:
+            return {}
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                placeholders = ','.join('?' * len(cookie_ids))
+                self._execute_sql(cursor, f"SELECT id, value, user_id, auto_confirm, remark, pause_duration, username, password, show_browser, created_at FROM cookies WHERE id IN ({placeholders})", tuple(cookie_ids))
+                details = {}
+                for result in cursor.fetchall():
+                    details[result[0]] = {
+                        'id': result[0],
+                        'value': result[1],
+                        'user_id': result[2],
+                        'auto_confirm': bool(result[3]),
+                        'remark': result[4] or '',
+                        'pause_duration': result[5] if result[5] is not None else 10,  # 0是有效值，表示不暂停
+                        'username': result[6] or '',
+                        'password': result[7] or '',
+                        'show_browser': bool(result[8]) if result[8] is not None else False,
+                        'created_at': result[9]
+                    }
+                return details
+            except Exception as e:
+                logger.error(f"批量获取Cookie详细信息失败: {e}")
+                return {}
+
+    def get_all_cookie_details(self) -> Dict[str, Dict[str, any]]:
+        """获取全部Cookie的详细信息快照，以cookie_id为键"""
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                self._execute_sql(cursor, "SELECT id FROM cookies")
+                cookie_ids = [row[0] for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"获取全部Cookie详细信息失败: {e}")
+                return {}
+        return self.get_cookie_details_bulk(cookie_ids)
+
     def update_auto_confirm(self, cookie_id: str, auto_confirm: bool) -> bool:
         """更新Cookie的自动确认发货设置"""
         with self.lock:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "UPDATE cookies SET auto_confirm = ? WHERE id = ?", (int(auto_confirm), cookie_id))
-                self.conn.commit()
+                self._commit()
                 logger.info(f"更新账号 {cookie_id} 自动确认发货设置: {'开启' if auto_confirm else '关闭'}")
                 return True
             except Exception as e:
@@ -1338,7 +1429,7 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "UPDATE cookies SET remark = ? WHERE id = ?", (remark, cookie_id))
-                self.conn.commit()
+                self._commit()
                 logger.info(f"更新账号 {cookie_id} 备注: {remark}")
                 return True
             except Exception as e:
@@ -1351,7 +1442,7 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "UPDATE cookies SET pause_duration = ? WHERE id = ?", (pause_duration, cookie_id))
-                self.conn.commit()
+                self._commit()
                 logger.info(f"更新账号 {cookie_id} 自动回复暂停时间: {pause_duration}分钟")
                 return True
             except Exception as e:
@@ -1370,7 +1461,7 @@ class DBManager:
                         logger.warning(f"账号 {cookie_id} 的pause_duration为NULL，使用默认值10分钟并修复数据库")
                         # 修复数据库中的NULL值
                         self._execute_sql(cursor, "UPDATE cookies SET pause_duration = 10 WHERE id = ?", (cookie_id,))
-                        self.conn.commit()
+                        self._commit()
                         return 10
                     return result[0]  # 返回实际值，包括0（0表示不暂停）
                 else:
@@ -1414,7 +1505,7 @@ class DBManager:
                 sql = f"UPDATE cookies SET {', '.join(update_fields)} WHERE id = ?"
                 
                 self._execute_sql(cursor, sql, tuple(params))
-                self.conn.commit()
+                self._commit()
                 logger.info(f"更新账号 {cookie_id} 信息成功: {update_fields}")
                 return True
             except Exception as e:
@@ -1466,12 +1557,12 @@ class DBManager:
                         logger.error(f"关键词唯一约束冲突: Cookie={cookie_id}, 关键词='{keyword}', {item_desc}")
                         raise ie
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"关键字保存成功: {cookie_id}, {len(keywords)}条")
                 return True
             except Exception as e:
                 logger.error(f"关键字保存失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def save_text_keywords_only(self, cookie_id: str, keywords: List[Tuple[str, str, str]]) -> bool:
@@ -1517,7 +1608,7 @@ class DBManager:
                         "INSERT INTO keywords (cookie_id, keyword, reply, item_id, type) VALUES (?, ?, ?, ?, 'text')",
                         (cookie_id, keyword, reply, normalized_item_id))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"文本关键字保存成功: {cookie_id}, {len(keywords)}条，图片关键词已保留")
                 return True
             except ValueError:
@@ -1525,7 +1616,7 @@ class DBManager:
                 raise
             except Exception as e:
                 logger.error(f"文本关键字保存失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
     
     def get_keywords(self, cookie_id: str) -> List[Tuple[str, str]]:
@@ -1586,12 +1677,12 @@ class DBManager:
                     "INSERT INTO keywords (cookie_id, keyword, reply, item_id, type, image_url) VALUES (?, ?, ?, ?, ?, ?)",
                     (cookie_id, keyword, '', normalized_item_id, 'image', image_url))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"图片关键词保存成功: {cookie_id}, 关键词: {keyword}, 图片: {image_url}")
                 return True
             except Exception as e:
                 logger.error(f"图片关键词保存失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def get_keywords_with_type(self, cookie_id: str) -> List[Dict[str, any]]:
@@ -1630,7 +1721,7 @@ class DBManager:
                     "UPDATE keywords SET image_url = ? WHERE cookie_id = ? AND keyword = ? AND type = 'image'",
                     (new_image_url, cookie_id, keyword))
 
-                self.conn.commit()
+                self._commit()
 
                 # 检查是否有行被更新
                 if cursor.rowcount > 0:
@@ -1642,7 +1733,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"更新关键词图片URL失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def delete_keyword_by_index(self, cookie_id: str, index: int) -> bool:
@@ -1660,7 +1751,7 @@ class DBManager:
                 if 0 <= index < len(rows):
                     rowid = rows[index][0]
                     self._execute_sql(cursor, "DELETE FROM keywords WHERE rowid = ?", (rowid,))
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"删除关键词成功: {cookie_id}, 索引: {index}")
                     return True
                 else:
@@ -1669,7 +1760,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"删除关键词失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
 
@@ -1709,7 +1800,7 @@ class DBManager:
                 INSERT OR REPLACE INTO cookie_status (cookie_id, enabled, updated_at)
                 VALUES (?, ?, CURRENT_TIMESTAMP)
                 ''', (cookie_id, enabled))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"保存Cookie状态: {cookie_id} -> {'启用' if enabled else '禁用'}")
             except Exception as e:
                 logger.error(f"保存Cookie状态失败: {e}")
@@ -1767,12 +1858,12 @@ class DBManager:
                     settings.get('max_bargain_rounds', 3),
                     settings.get('custom_prompts', '')
                 ))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"AI回复设置保存成功: {cookie_id}")
                 return True
             except Exception as e:
                 logger.error(f"保存AI回复设置失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def get_ai_reply_settings(self, cookie_id: str) -> dict:
@@ -1865,7 +1956,7 @@ class DBManager:
                 INSERT OR REPLACE INTO default_replies (cookie_id, enabled, reply_content, reply_once, updated_at)
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
                 ''', (cookie_id, enabled, reply_content, reply_once))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"保存默认回复设置: {cookie_id} -> {'启用' if enabled else '禁用'}, 只回复一次: {'是' if reply_once else '否'}")
             except Exception as e:
                 logger.error(f"保存默认回复设置失败: {e}")
@@ -1922,7 +2013,7 @@ class DBManager:
                 INSERT OR IGNORE INTO default_reply_records (cookie_id, chat_id)
                 VALUES (?, ?)
                 ''', (cookie_id, chat_id))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"记录默认回复: {cookie_id} -> {chat_id}")
             except Exception as e:
                 logger.error(f"记录默认回复失败: {e}")
@@ -1947,7 +2038,7 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 cursor.execute('DELETE FROM default_reply_records WHERE cookie_id = ?', (cookie_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"清空默认回复记录: {cookie_id}")
             except Exception as e:
                 logger.error(f"清空默认回复记录失败: {e}")
@@ -1958,12 +2049,12 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "DELETE FROM default_replies WHERE cookie_id = ?", (cookie_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"删除默认回复设置: {cookie_id}")
                 return True
             except Exception as e:
                 logger.error(f"删除默认回复设置失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     # -------------------- 通知渠道操作 --------------------
@@ -1976,13 +2067,13 @@ class DBManager:
                 INSERT INTO notification_channels (name, type, config, user_id)
                 VALUES (?, ?, ?, ?)
                 ''', (name, channel_type, config, user_id))
-                self.conn.commit()
+                self._commit()
                 channel_id = cursor.lastrowid
                 logger.debug(f"创建通知渠道: {name} (ID: {channel_id})")
                 return channel_id
             except Exception as e:
                 logger.error(f"创建通知渠道失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 raise
 
     def get_notification_channels(self, user_id: int = None) -> List[Dict[str, any]]:
@@ -2057,12 +2148,12 @@ class DBManager:
                 SET name = ?, config = ?, enabled = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
                 ''', (name, config, enabled, channel_id))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"更新通知渠道: {channel_id}")
                 return cursor.rowcount > 0
             except Exception as e:
                 logger.error(f"更新通知渠道失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def delete_notification_channel(self, channel_id: int) -> bool:
@@ -2071,12 +2162,12 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "DELETE FROM notification_channels WHERE id = ?", (channel_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"删除通知渠道: {channel_id}")
                 return cursor.rowcount > 0
             except Exception as e:
                 logger.error(f"删除通知渠道失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     # -------------------- 消息通知配置操作 --------------------
@@ -2089,12 +2180,12 @@ class DBManager:
                 INSERT OR REPLACE INTO message_notifications (cookie_id, channel_id, enabled)
                 VALUES (?, ?, ?)
                 ''', (cookie_id, channel_id, enabled))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"设置消息通知: {cookie_id} -> {channel_id}")
                 return True
             except Exception as e:
                 logger.error(f"设置消息通知失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def get_account_notifications(self, cookie_id: str) -> List[Dict[str, any]]:
@@ -2165,12 +2256,12 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "DELETE FROM message_notifications WHERE id = ?", (notification_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"删除消息通知配置: {notification_id}")
                 return cursor.rowcount > 0
             except Exception as e:
                 logger.error(f"删除消息通知配置失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def delete_account_notifications(self, cookie_id: str) -> bool:
@@ -2179,12 +2270,12 @@ class DBManager:
             try:
                 cursor = self.conn.cursor()
                 self._execute_sql(cursor, "DELETE FROM message_notifications WHERE cookie_id = ?", (cookie_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"删除账号通知配置: {cookie_id}")
                 return cursor.rowcount > 0
             except Exception as e:
                 logger.error(f"删除账号通知配置失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     # -------------------- 备份和恢复操作 --------------------
@@ -2345,13 +2436,13 @@ class DBManager:
                         cursor.executemany(f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({placeholders})", rows)
 
                 # 提交事务
-                self.conn.commit()
+                self._commit()
                 logger.info("导入备份成功")
                 return True
 
             except Exception as e:
                 logger.error(f"导入备份失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     # -------------------- 系统设置操作 --------------------
@@ -2376,12 +2467,12 @@ class DBManager:
                 INSERT OR REPLACE INTO system_settings (key, value, description, updated_at)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP)
                 ''', (key, value, description))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"设置系统设置: {key}")
                 return True
             except Exception as e:
                 logger.error(f"设置系统设置失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def get_all_system_settings(self) -> Dict[str, str]:
@@ -2416,16 +2507,16 @@ class DBManager:
                 VALUES (?, ?, ?)
                 ''', (username, email, password_hash))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"创建用户成功: {username} ({email})")
                 return True
             except sqlite3.IntegrityError as e:
                 logger.error(f"创建用户失败，用户名或邮箱已存在: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
             except Exception as e:
                 logger.error(f"创建用户失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
@@ -2502,7 +2593,7 @@ class DBManager:
                 ''', (password_hash, username))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"用户 {username} 密码更新成功")
                     return True
                 else:
@@ -2511,7 +2602,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"更新用户密码失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def generate_verification_code(self) -> str:
@@ -2599,12 +2690,12 @@ class DBManager:
                 VALUES (?, ?, ?)
                 ''', (session_id, captcha_text.upper(), expires_at))
 
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"保存图形验证码成功: {session_id}")
                 return True
             except Exception as e:
                 logger.error(f"保存图形验证码失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def verify_captcha(self, session_id: str, user_input: str) -> bool:
@@ -2625,7 +2716,7 @@ class DBManager:
                 if row:
                     # 删除已使用的验证码
                     cursor.execute('DELETE FROM captcha_codes WHERE id = ?', (row[0],))
-                    self.conn.commit()
+                    self._commit()
                     logger.debug(f"图形验证码验证成功: {session_id}")
                     return True
                 else:
@@ -2647,12 +2738,12 @@ class DBManager:
                 VALUES (?, ?, ?, ?)
                 ''', (email, code, code_type, expires_at))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"保存验证码成功: {email} ({code_type})")
                 return True
             except Exception as e:
                 logger.error(f"保存验证码失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def verify_email_code(self, email: str, code: str, code_type: str = 'register') -> bool:
@@ -2675,7 +2766,7 @@ class DBManager:
                     cursor.execute('''
                     UPDATE email_verifications SET used = TRUE WHERE id = ?
                     ''', (row[0],))
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"验证码验证成功: {email} ({code_type})")
                     return True
                 else:
@@ -2864,7 +2955,7 @@ class DBManager:
                 ''', (name, card_type, api_config_str, text_content, data_content, image_url,
                       description, enabled, delay_seconds, is_multi_spec,
                       spec_name, spec_value, user_id))
-                self.conn.commit()
+                self._commit()
                 card_id = cursor.lastrowid
 
                 if is_multi_spec:
@@ -3058,7 +3149,7 @@ class DBManager:
                 self._execute_sql(cursor, sql, params)
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"更新卡券成功: ID {card_id}")
                     return True
                 else:
@@ -3066,7 +3157,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"更新卡券失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 raise
 
     def update_card_image_url(self, card_id: int, new_image_url: str) -> bool:
@@ -3080,7 +3171,7 @@ class DBManager:
                     "UPDATE cards SET image_url = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND type = 'image'",
                     (new_image_url, card_id))
 
-                self.conn.commit()
+                self._commit()
 
                 # 检查是否有行被更新
                 if cursor.rowcount > 0:
@@ -3092,7 +3183,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"更新卡券图片URL失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     # ==================== 自动发货规则方法 ====================
@@ -3107,7 +3198,7 @@ class DBManager:
                 INSERT INTO delivery_rules (keyword, card_id, delivery_count, enabled, description, user_id)
                 VALUES (?, ?, ?, ?, ?, ?)
                 ''', (keyword, card_id, delivery_count, enabled, description, user_id))
-                self.conn.commit()
+                self._commit()
                 rule_id = cursor.lastrowid
                 logger.info(f"创建发货规则成功: {keyword} -> 卡券ID {card_id} (规则ID: {rule_id})")
                 return rule_id
@@ -3312,7 +3403,7 @@ class DBManager:
                 self._execute_sql(cursor, sql, params)
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"更新发货规则成功: ID {rule_id}")
                     return True
                 else:
@@ -3320,7 +3411,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"更新发货规则失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 raise
 
     def increment_delivery_times(self, rule_id: int):
@@ -3333,7 +3424,7 @@ class DBManager:
                 SET delivery_times = delivery_times + 1, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
                 ''', (rule_id,))
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"发货规则 {rule_id} 发货次数已增加")
             except Exception as e:
                 logger.error(f"更新发货次数失败: {e}")
@@ -3476,7 +3567,7 @@ class DBManager:
                 self._execute_sql(cursor, "DELETE FROM cards WHERE id = ?", (card_id,))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"删除卡券成功: ID {card_id}")
                     return True
                 else:
@@ -3484,7 +3575,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"删除卡券失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 raise
 
     def delete_delivery_rule(self, rule_id: int, user_id: int = None):
@@ -3498,7 +3589,7 @@ class DBManager:
                     self._execute_sql(cursor, "DELETE FROM delivery_rules WHERE id = ?", (rule_id,))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"删除发货规则成功: ID {rule_id} (用户ID: {user_id})")
                     return True
                 else:
@@ -3506,7 +3597,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"删除发货规则失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 raise
 
     def consume_batch_data(self, card_id: int):
@@ -3543,14 +3634,14 @@ class DBManager:
                 WHERE id = ?
                 ''', (new_data_content, card_id))
 
-                self.conn.commit()
+                self._commit()
 
                 logger.info(f"消费批量数据成功: 卡券ID={card_id}, 剩余={len(remaining_lines)}条")
                 return first_line
 
             except Exception as e:
                 logger.error(f"消费批量数据失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return None
 
 
@@ -3581,13 +3672,13 @@ class DBManager:
                 VALUES (?, ?, ?, ?, ?, ?, ?)
                 ''', (order_id, card_id, card_type, cleaned_raw, cleaned_final, cookie_id, next_sequence))
 
-                self.conn.commit()
+                self._commit()
                 logger.debug(f"记录订单发货内容成功: order_id={order_id}, card_id={card_id}, sequence={next_sequence}")
                 return True
 
             except Exception as e:
                 logger.error(f"记录订单发货内容失败: order_id={order_id}, card_id={card_id}, 错误: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
 
@@ -3631,7 +3722,7 @@ class DBManager:
 
                 # 如果是新插入的记录，直接返回成功
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"新增商品基本信息: {item_id} - {item_title}")
                     return True
 
@@ -3673,12 +3764,12 @@ class DBManager:
                     else:
                         logger.debug(f"商品信息无需更新: {item_id}")
 
-                self.conn.commit()
+                self._commit()
                 return True
 
         except Exception as e:
             logger.error(f"保存商品基本信息失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def save_item_info(self, cookie_id: str, item_id: str, item_data = None) -> bool:
@@ -3775,12 +3866,12 @@ class DBManager:
                         ))
                     logger.info(f"新增商品信息: {item_id}")
 
-                self.conn.commit()
+                self._commit()
                 return True
 
         except Exception as e:
             logger.error(f"保存商品信息失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def get_item_info(self, cookie_id: str, item_id: str) -> Optional[Dict]:
@@ -3832,7 +3923,7 @@ class DBManager:
                 ''', (is_multi_spec, cookie_id, item_id))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"更新商品多规格状态成功: {item_id} -> {is_multi_spec}")
                     return True
                 else:
@@ -3841,7 +3932,7 @@ class DBManager:
 
         except Exception as e:
             logger.error(f"更新商品多规格状态失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def get_item_multi_spec_status(self, cookie_id: str, item_id: str) -> bool:
@@ -3875,7 +3966,7 @@ class DBManager:
                 ''', (multi_quantity_delivery, cookie_id, item_id))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"更新商品多数量发货状态成功: {item_id} -> {multi_quantity_delivery}")
                     return True
                 else:
@@ -3884,7 +3975,7 @@ class DBManager:
 
         except Exception as e:
             logger.error(f"更新商品多数量发货状态失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def get_item_multi_quantity_delivery_status(self, cookie_id: str, item_id: str) -> Optional[bool]:
@@ -4006,7 +4097,7 @@ class DBManager:
                 ''', (item_detail, cookie_id, item_id))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"更新商品详情成功: {item_id}")
                     return True
                 else:
@@ -4015,7 +4106,7 @@ class DBManager:
 
         except Exception as e:
             logger.error(f"更新商品详情失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def update_item_title_only(self, cookie_id: str, item_id: str, item_title: str) -> bool:
@@ -4050,13 +4141,13 @@ class DBManager:
                       cookie_id, item_id, cookie_id, item_id, cookie_id, item_id,
                       cookie_id, item_id, cookie_id, item_id))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"更新商品标题成功: {item_id} - {item_title}")
                 return True
 
         except Exception as e:
             logger.error(f"更新商品标题失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def batch_save_item_basic_info(self, items_data: list) -> int:
@@ -4161,7 +4252,7 @@ class DBManager:
                              (cookie_id, item_id))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"删除商品信息成功: {cookie_id} - {item_id}")
                     return True
                 else:
@@ -4170,7 +4261,7 @@ class DBManager:
 
         except Exception as e:
             logger.error(f"删除商品信息失败: {e}")
-            self.conn.rollback()
+            self._rollback()
             return False
 
     def batch_delete_item_info(self, items_to_delete: list) -> int:
@@ -4283,12 +4374,12 @@ class DBManager:
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
                 ''', (user_id, key, value, description))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"用户设置更新成功: user_id={user_id}, key={key}")
                 return True
             except Exception as e:
                 logger.error(f"设置用户配置失败: {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     # ==================== 管理员专用方法 ====================
@@ -4492,12 +4583,12 @@ class DBManager:
                           quantity, amount, order_status or 'unknown', cookie_id))
                     logger.info(f"插入新订单: {order_id}")
 
-                self.conn.commit()
+                self._commit()
                 return True
 
             except Exception as e:
                 logger.error(f"插入或更新订单失败: {order_id} - {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def get_order_by_id(self, order_id: str):
@@ -4532,6 +4623,48 @@ class DBManager:
                 logger.error(f"获取订单信息失败: {order_id} - {e}")
                 return None
 
+    def get_orders_by_ids(self, order_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取订单信息，一次IN查询代替逐个查询
+
+        Args:
+            order_ids: 订单ID列表
+
+        Returns:
+            Dict以order_id为键，值与get_order_by_id返回结构一致
+        """
+        if not order_ids:
+            return {}
+        with self.lock:
+            try:
+                cursor = self.conn.cursor()
+                placeholders = ','.join('?' * len(order_ids))
+                cursor.execute(f'''
+                SELECT order_id, item_id, buyer_id, spec_name, spec_value,
+                       quantity, amount, order_status, cookie_id, created_at, updated_at
+                FROM orders WHERE order_id IN ({placeholders})
+                ''', tuple(order_ids))
+
+                orders = {}
+                for row in cursor.fetchall():
+                    orders[row[0]] = {
+                        'order_id': row[0],
+                        'item_id': row[1],
+                        'buyer_id': row[2],
+                        'spec_name': row[3],
+                        'spec_value': row[4],
+                        'quantity': row[5],
+                        'amount': row[6],
+                        'order_status': row[7],
+                        'cookie_id': row[8],
+                        'created_at': row[9],
+                        'updated_at': row[10]
+                    }
+                return orders
+
+            except Exception as e:
+                logger.error(f"批量获取订单信息失败: {e}")
+                return {}
+
     def get_orders_by_cookie(self, cookie_id: str, limit: int = 100):
         """根据Cookie ID获取订单列表"""
         with self.lock:
@@ -4601,7 +4734,7 @@ class DBManager:
                 cursor.execute(f"DELETE FROM {table_name} WHERE {primary_key} = ?", (record_id,))
 
                 if cursor.rowcount > 0:
-                    self.conn.commit()
+                    self._commit()
                     logger.info(f"删除表记录成功: {table_name}.{record_id}")
                     return True
                 else:
@@ -4610,7 +4743,7 @@ class DBManager:
 
             except Exception as e:
                 logger.error(f"删除表记录失败: {table_name}.{record_id} - {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def clear_table_data(self, table_name: str):
@@ -4625,13 +4758,13 @@ class DBManager:
                 # 重置自增ID（如果有的话）
                 cursor.execute(f"DELETE FROM sqlite_sequence WHERE name = ?", (table_name,))
 
-                self.conn.commit()
+                self._commit()
                 logger.info(f"清空表数据成功: {table_name}")
                 return True
 
             except Exception as e:
                 logger.error(f"清空表数据失败: {table_name} - {e}")
-                self.conn.rollback()
+                self._rollback()
                 return False
 
     def upgrade_keywords_table_for_image_support(self, cursor):
@@ -4749,7 +4882,7 @@ class DBManager:
                         VALUES (?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
                     ''', (item_id, cookie_id, reply_content))
 
-                self.conn.commit()
+                self._commit()
             return True
         except Exception as e:
             logger.error(f"更新商品回复失败: {e}")
@@ -4807,7 +4940,7 @@ class DBManager:
                     DELETE FROM item_replay
                     WHERE cookie_id = ? AND item_id = ?
                 ''', (cookie_id, item_id))
-                self.conn.commit()
+                self._commit()
                 # 判断是否有删除行
                 return cursor.rowcount > 0
         except Exception as e:
@@ -4844,7 +4977,7 @@ class DBManager:
                         success_count += 1
                     else:
                         failed_count += 1
-                self.conn.commit()
+                self._commit()
         except Exception as e:
             logger.error(f"批量删除商品回复失败: {e}")
             # 整体失败则视为全部失败
@@ -4879,7 +5012,7 @@ class DBManager:
                     (cookie_id, event_type, event_description, processing_result, processing_status, error_message)
                     VALUES (?, ?, ?, ?, ?, ?)
                 ''', (cookie_id, event_type, event_description, processing_result, processing_status, error_message))
-                self.conn.commit()
+                self._commit()
                 return True
         except Exception as e:
             logger.error(f"添加风控日志失败: {e}")
@@ -4925,7 +5058,7 @@ class DBManager:
 
                     sql = f"UPDATE risk_control_logs SET {', '.join(update_fields)} WHERE id = ?"
                     cursor.execute(sql, params)
-                    self.conn.commit()
+                    self._commit()
                     return cursor.rowcount > 0
 
                 return False
@@ -5017,7 +5150,7 @@ class DBManager:
             with self.lock:
                 cursor = self.conn.cursor()
                 cursor.execute('DELETE FROM risk_control_logs WHERE id = ?', (log_id,))
-                self.conn.commit()
+                self._commit()
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"删除风控日志失败: {e}")
@@ -5102,7 +5235,7 @@ class DBManager:
                     stats['email_verifications'] = 0
                 
                 # 提交更改
-                self.conn.commit()
+                self._commit()
                 
                 # 执行VACUUM以释放磁盘空间（仅当清理了大量数据时）
                 total_cleaned = sum(stats.values())
@@ -17,6 +17,26 @@ from utils.qr_login import qr_login_manager
 from db_manager import db_manager
 from loguru import logger
 
+# ASCII 二维码渲染缓存：同一链接只做一次矩阵计算
+_ascii_qr_cache = {}
+
+
+def render_ascii_qr(qr_url: str) -> str:
+    """将链接渲染为终端ASCII二维码，结果按链接缓存"""
+    ascii_qr = _ascii_qr_cache.get(qr_url)
+    if ascii_qr is None:
+        import io
+        import qrcode
+        qr = qrcode.QRCode(version=1, box_size=1, border=1)
+        qr.add_data(qr_url)
+        qr.make(fit=True)
+        buf = io.StringIO()
+        qr.print_ascii(out=buf, invert=True)
+        ascii_qr = buf.getvalue()
+        _ascii_qr_cache[qr_url] = ascii_qr
+    return ascii_qr
+
+
 async def main():
     """主函数"""
     try:
@@ -39,13 +59,10 @@ async def main():
         print(f"\n[2/3] 请使用手机闲鱼APP扫描下方二维码:")
         print("-" * 50)
 
-        # 如果安装了qrcode库，显示二维码
+        # 如果安装了qrcode库，显示二维码（渲染结果缓存，整段一次写出）
         try:
-            import qrcode
-            qr = qrcode.QRCode(version=1, box_size=1, border=1)
-            qr.add_data(qr_url)
-            qr.make(fit=True)
-            qr.print_ascii(invert=True)
+            sys.stdout.write(render_ascii_qr(qr_url))
+            sys.stdout.flush()
         except ImportError:
             # 如果没有qrcode库，只显示链接
             print(f"二维码链接: {qr_url}")
@@ -55,78 +72,80 @@ async def main():
         print("-" * 50)
         print("等待扫码中...\n")
 
-        # 3. 等待扫码结果
+        # 3. 等待扫码结果（事件驱动：状态进入终态时立即唤醒，无需轮询）
         max_wait = 120  # 最多等待120秒
-        check_interval = 2  # 每2秒检查一次
-        elapsed = 0
-
-        while elapsed < max_wait:
-            # 清理过期会话
-            qr_login_manager.cleanup_expired_sessions()
-
-            # 检查状态
-            status_info = qr_login_manager.get_session_status(session_id)
-
-            if status_info['status'] == 'success':
-                print("✅ 扫码成功！")
-
-                # 获取Cookie
-                cookies_info = qr_login_manager.get_session_cookies(session_id)
-                if cookies_info:
-                    cookies_str = cookies_info['cookies']
-                    unb = cookies_info.get('unb', '')
-
-                    # 提取cookie_id（通常是unb的值）
-                    cookie_id = unb if unb else f"user_{int(time.time())}"
-
-                    print(f"\n[3/3] 保存Cookie到数据库...")
-                    print(f"Cookie ID: {cookie_id}")
-                    print(f"Cookie长度: {len(cookies_str)} 字符")
-
-                    # 询问是否保存
-                    save = input("\n是否保存到数据库? (y/n): ")
-                    if save.lower() == 'y':
-                        # 保存到数据库
-                        success = db_manager.save_cookie(
-                            cookie_id=cookie_id,
-                            cookies_str=cookies_str,
-                            user_id=None  # 可以后续更新
-                        )
-
-                        if success:
-                            print("✅ Cookie已保存到数据库")
-                            print(f"\n使用以下命令重启服务:")
-                            print(f"python sb.py stop && python sb.py start")
-                        else:
-                            print("❌ 保存Cookie失败")
-                    else:
-                        print("\n未保存，Cookie内容:")
-                        print("-" * 50)
-                        print(cookies_str)
-                        print("-" * 50)
+        session = qr_login_manager.sessions.get(session_id)
+
+        async def _show_progress():
+            """每10秒打印一次等待进度"""
+            elapsed = 0
+            while True:
+                await asyncio.sleep(10)
+                elapsed += 10
+                if qr_login_manager.get_session_status(session_id)['status'] == 'scanned':
+                    print("📱 已扫码，请在手机上确认登录...")
+                print(f"⏰ 已等待 {elapsed} 秒...")
 
-                    return
+        progress_task = asyncio.create_task(_show_progress())
+        try:
+            await asyncio.wait_for(session.event.wait(), timeout=max_wait)
+        except asyncio.TimeoutError:
+            print("❌ 扫码超时，请重新运行")
+            return
+        finally:
+            progress_task.cancel()
+
+        status_info = qr_login_manager.get_session_status(session_id)
+
+        if status_info['status'] == 'success':
+            print("✅ 扫码成功！")
+
+            # 获取Cookie
+            cookies_info = qr_login_manager.get_session_cookies(session_id)
+            if cookies_info:
+                cookies_str = cookies_info['cookies']
+                unb = cookies_info.get('unb', '')
+
+                # 提取cookie_id（通常是unb的值）
+                cookie_id = unb if unb else f"user_{int(time.time())}"
+
+                print(f"\n[3/3] 保存Cookie到数据库...")
+                print(f"Cookie ID: {cookie_id}")
+                print(f"Cookie长度: {len(cookies_str)} 字符")
+
+                # 询问是否保存（stdin 读取放线程池，避免阻塞事件循环）
+                save = await asyncio.get_running_loop().run_in_executor(
+                    None, input, "\n是否保存到数据库? (y/n): ")
+                if save.lower() == 'y':
+                    # 保存到数据库
+                    success = db_manager.save_cookie(
+                        cookie_id=cookie_id,
+                        cookies_str=cookies_str,
+                        user_id=None  # 可以后续更新
+                    )
+
+                    if success:
+                        print("✅ Cookie已保存到数据库")
+                        print(f"\n使用以下命令重启服务:")
+                        print(f"python sb.py stop && python sb.py start")
+                    else:
+                        print("❌ 保存Cookie失败")
                 else:
-                    print("❌ 获取Cookie失败")
-                    return
-
-            elif status_info['status'] == 'expired':
-                print("❌ 二维码已过期")
-                return
+                    print("\n未保存，Cookie内容:")
+                    print("-" * 50)
+                    print(cookies_str)
+                    print("-" * 50)
+            else:
+                print("❌ 获取Cookie失败")
 
-            elif status_info['status'] == 'scanned':
-                if elapsed % 10 == 0:  # 每10秒提醒一次
-                    print("📱 已扫码，请在手机上确认登录...")
-
-            # 等待下次检查
-            await asyncio.sleep(check_interval)
-            elapsed += check_interval
+        elif status_info['status'] == 'expired':
+            print("❌ 二维码已过期")
 
-            # 显示进度
-            if elapsed % 10 == 0:
-                print(f"⏰ 已等待 {elapsed} 秒...")
+        elif status_info['status'] == 'verification_required':
+            print(f"❌ 账号被风控，需要手机验证: {status_info.get('verification_url', '')}")
 
-        print("❌ 扫码超时，请重新运行")
+        else:
+            print(f"❌ 登录未完成: {status_info['status']}")
 
     except KeyboardInterrupt:
         print("\n\n用户取消操作")
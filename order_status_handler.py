@@ -4,13 +4,36 @@
 """
 
 import re
+import sys
 import json
 import time
-import uuid
+import heapq
+import random
+import secrets
+import itertools
+import sqlite3
 import threading
 import asyncio
+from collections import deque, OrderedDict
 from loguru import logger
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set
+
+from db_manager import db_manager
+
+# 可选依赖：pyahocorasick，可将消息推断的多关键字匹配合并为单次DFA扫描
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# 可选依赖：xxhash+orjson，消息指纹改走C侧一趟哈希，
+# 省去排序+repr大字符串+SipHash的开销
+try:
+    import xxhash
+    import orjson
+except ImportError:
+    xxhash = None
+    orjson = None
 
 # ==================== 订单状态处理器配置 ====================
 # 订单状态处理器配置
@@ -19,9 +42,290 @@ ORDER_STATUS_HANDLER_CONFIG = {
     'strict_validation': True,                     # 是否启用严格的状态转换验证
     'log_level': 'info',                          # 日志级别 (debug/info/warning/error)
     'max_pending_age_hours': 24,                  # 待处理更新的最大保留时间（小时）
+    'max_pending_orders': 10000,                  # 待处理队列的订单数量上限（超出时淘汰最旧）
     'enable_status_logging': True,                # 是否启用详细的状态变更日志
 }
 
+# ==================== 订单ID提取正则（模块加载时预编译） ====================
+_RE_ORDER_ID_URL = re.compile(r'orderId=(\d+)')
+_RE_ORDER_DETAIL = re.compile(r'order_detail\?id=(\d+)')
+# 方法3兜底搜索：四种订单ID模式合并为一个交替正则，整串只扫一遍
+# orderId=123 / orderId:123、order_detail?id=123、"id":"123"、bizOrderId=123
+_RE_ORDER_ID_FALLBACK = re.compile(
+    r'orderId[=:](\d{10,})'
+    r'|order_detail\?id=(\d{10,})'
+    r'|"id"\s*:\s*"?(\d{10,})"?'
+    r'|bizOrderId[=:](\d{10,})'
+)
+# 交替正则前的廉价子串预检：任一标记都不存在时直接跳过正则
+_ORDER_ID_MARKERS = ('orderId', 'order_detail', '"id"', 'bizOrderId')
+
+# 中英文方括号删除表：translate单次C级遍历，替代多次strip产生的中间字符串
+_BRACKET_TRANS = str.maketrans('', '', '[]【】')
+
+# 系统消息原文与目标状态的映射（模块级常量，键做intern让热路径
+# 的dict探测退化为指针比较，不再每条消息重建dict）
+_MESSAGE_STATUS_MAPPING = {sys.intern(k): v for k, v in {
+    '[买家确认收货，交易成功]': 'completed',
+    '[你已确认收货，交易成功]': 'completed',  # 已完成
+    '[你已发货]': 'shipped',  # 已发货
+    '你已发货': 'shipped',  # 已发货（无方括号）
+    '[你已发货，请等待买家确认收货]': 'shipped',  # 已发货（完整格式）
+    '[我已付款，等待你发货]': 'pending_ship',  # 已付款，等待发货
+    '[我已拍下，待付款]': 'processing',  # 已拍下，待付款
+    '[买家已付款]': 'pending_ship',  # 买家已付款
+    '[付款完成]': 'pending_ship',  # 付款完成
+    '[已付款，待发货]': 'pending_ship',  # 已付款，待发货
+    '[退款成功，钱款已原路退返]': 'cancelled',  # 退款成功，设置为已关闭
+    '[你关闭了订单，钱款已原路退返]': 'cancelled',  # 卖家关闭订单，设置为已关闭
+}.items()}
+
+# 归一化倒排映射：去掉方括号后的文本也能直接命中状态，
+# 非精确格式的消息不必落入完整的推断路径
+_NORM_STATUS_MAPPING = {
+    k.translate(_BRACKET_TRANS).strip(): v
+    for k, v in _MESSAGE_STATUS_MAPPING.items()
+}
+
+
+def _build_status_dispatch():
+    """生成映射专用的分派函数：intern后的身份比较链
+
+    在十几个常量键的规模下，`is`比较链省去dict的哈希计算与探测；
+    发货/付款类消息出现频率最高，对应分支排在最前。
+    """
+    priority = {'pending_ship': 0, 'shipped': 1, 'processing': 2,
+                'completed': 3, 'cancelled': 4}
+    items = sorted(_MESSAGE_STATUS_MAPPING.items(),
+                   key=lambda kv: priority.get(kv[1], 9))
+
+    ns = {}
+    lines = ['def _dispatch_status(m):']
+    for i, (msg, status) in enumerate(items):
+        ns[f'_S{i}'] = msg
+        branch = 'if' if i == 0 else 'elif'
+        lines.append(f'    {branch} m is _S{i}: return {status!r}')
+    lines.append('    return None')
+    exec('\n'.join(lines), ns)
+    return ns['_dispatch_status']
+
+
+# 身份分派要求入参已intern（handle_system_message入口处完成）
+_dispatch_status = _build_status_dispatch()
+
+
+# ==================== 状态推断关键字（模块加载时编译为单个交替正则） ====================
+def _kw_regex(*keywords: str) -> "re.Pattern":
+    """把一组关键字编译成单个交替正则，一次扫描代替K次子串查找"""
+    return re.compile('|'.join(map(re.escape, keywords)))
+
+
+# taskName推断用的关键字桶
+_RE_TASK_CANCELLED = _kw_regex('退款成功', '退货成功', '退货退款成功', '退款退货成功', '关闭订单',
+                               '交易关闭', '退款已完成', '交易成功，有退款', '交易成功，已退款')
+_RE_TASK_COMPLETED = _kw_regex('确认收货', '交易成功', '评价_卖家', '评价_买家', '期待评价')
+_RE_TASK_REFUNDING = _kw_regex('改为仅退款已同意', '发起退款申请', '申请退款', '退款处理中')
+_RE_TASK_REFUND_CANCELLED = _kw_regex('退款申请已撤销', '退款申请已取消', '取消退款申请')
+
+# 系统消息文本推断用的关键字桶
+_RE_MSG_CANCELLED = _kw_regex('退款成功', '退货成功', '退货退款成功',
+                              '钱款已原路退返', '钱款已退回', '款项已退回',
+                              '交易成功，已退款', '交易关闭，已退款')
+_RE_MSG_TRADE_RESULT = _kw_regex('交易成功', '交易关闭')
+_RE_MSG_REFUND_REQUEST = _kw_regex('退款申请', '退货申请')
+_RE_MSG_AGREED = _kw_regex('已同意', '同意了', '通过了', '同意退款', '同意退货')
+_RE_MSG_REVOKED = _kw_regex('已撤销', '撤销了', '取消了', '已取消')
+_RE_MSG_PENDING_SHIP = _kw_regex('买家已付款', '付款完成', '已付款', '等待你发货', '待发货')
+_RE_MSG_SHIPPED = _kw_regex('你已发货', '已发货', '等待买家确认收货')
+_RE_MSG_EVALUATION = _kw_regex('快给ta一个评价吧', '快给TA一个评价吧', '快给他一个评价吧', '快给她一个评价吧',
+                               '我完成了评价', '期待你的评价', '有新交易评价', '有新的交易评价')
+_RE_MSG_COMPLETED = _kw_regex('确认收货', '交易成功')
+_RE_MSG_CLOSED = _kw_regex('交易关闭', '关闭了订单')
+
+# 退款消息检查用的关键字桶（tip/提示文本在一次扫描内判定）
+_RE_REFUND_SUCCESS = _kw_regex('退款成功', '钱款已原路退返', '钱款已退回', '退款已完成',
+                               '交易关闭，已退款', '交易成功，已退款', '交易成功，有退款')
+_RE_REFUND_APPLY = _kw_regex('退款申请', '退货申请')
+_RE_REFUND_HANDLING_TIP = _kw_regex('已同意', '同意', '处理中')
+_RE_REFUND_HANDLING_EXTRA = _kw_regex('已同意', '处理中', '待处理')
+_RE_RETURN_TASK = _kw_regex('退货', '退货退款')
+
+# Aho-Corasick自动机：一次扫描得到所有命中的关键字桶标签，
+# 随后按原有优先级在命中集合上做判定；pyahocorasick缺失时退回正则路径
+_MSG_KEYWORD_TAGS = {
+    'cancelled': ('退款成功', '退货成功', '退货退款成功', '钱款已原路退返', '钱款已退回',
+                  '款项已退回', '交易成功，已退款', '交易关闭，已退款'),
+    'refunded': ('已退款',),
+    'trade_result': ('交易成功', '交易关闭'),
+    'refund_request': ('退款申请', '退货申请'),
+    'agreed': ('已同意', '同意了', '通过了', '同意退款', '同意退货'),
+    'revoked': ('已撤销', '撤销了', '取消了', '已取消'),
+    'pending_ship': ('买家已付款', '付款完成', '已付款', '等待你发货', '待发货'),
+    'shipped': ('你已发货', '已发货', '等待买家确认收货'),
+    'evaluation': ('快给ta一个评价吧', '快给TA一个评价吧', '快给他一个评价吧', '快给她一个评价吧',
+                   '我完成了评价', '期待你的评价', '有新交易评价', '有新的交易评价'),
+    'completed': ('确认收货', '交易成功'),
+    'closed': ('交易关闭', '关闭了订单'),
+}
+
+_MSG_AC = None
+if ahocorasick is not None:
+    _MSG_AC = ahocorasick.Automaton()
+    _word_tags: Dict[str, set] = {}
+    for _tag, _words in _MSG_KEYWORD_TAGS.items():
+        for _word in _words:
+            _word_tags.setdefault(_word, set()).add(_tag)
+    for _word, _tags in _word_tags.items():
+        _MSG_AC.add_word(_word, frozenset(_tags))
+    _MSG_AC.make_automaton()
+    del _word_tags
+
+
+# 临时订单ID：随机前缀进程启动时只取一次，之后仅计数器自增+格式化，
+# 不再每次经过uuid4的随机源读取与对象分配；计数器保证进程内唯一，
+# 随机前缀避免跨进程碰撞
+_TEMP_ID_SEED = secrets.token_hex(4)
+_TEMP_ID_COUNTER = itertools.count()
+
+
+def _gen_temp_id() -> str:
+    """生成待处理队列使用的临时订单ID"""
+    return f"temp_{time.time_ns() // 1_000_000}_{_TEMP_ID_SEED}{next(_TEMP_ID_COUNTER):x}"
+
+
+def _dig(obj, *keys, default=None):
+    """沿着键路径逐层取值，任一层缺失或非dict时返回default
+
+    相比链式 .get(..., {}).get(...) 不会在每个缺失层级分配空dict。
+    """
+    for key in keys:
+        if not isinstance(obj, dict):
+            return default
+        obj = obj.get(key)
+    return obj if obj is not None else default
+
+
+def _as_message_dict(message):
+    """把非dict消息归一化为 {'__raw__': str(...)}
+
+    入队（handle_system_message等）与匹配（on_order_id_extracted）
+    两侧必须走同一归一化，指纹才可比；形态不一致时哈希匹配
+    永远落空，只能退化成FIFO。
+    """
+    if isinstance(message, dict):
+        return message
+    return {'__raw__': str(message)}
+
+
+def _message_fingerprint(message) -> int:
+    """计算消息去重指纹，结果缓存在消息dict自身上
+
+    排序+字符串化+哈希只做一次，入队与匹配共用同一结果。
+    下划线开头的内部缓存键不参与计算，处理过程中附加的
+    备注字段不会影响指纹稳定性。
+    """
+    if not isinstance(message, dict):
+        if xxhash is not None:
+            return xxhash.xxh3_64_intdigest(repr(message).encode())
+        return hash(str(message))
+
+    cached = message.get('_msg_fingerprint')
+    if cached is not None:
+        return cached
+
+    payload = {k: v for k, v in message.items()
+               if not (isinstance(k, str) and k.startswith('_'))}
+    if xxhash is not None:
+        try:
+            fingerprint = xxhash.xxh3_64_intdigest(
+                orjson.dumps(payload, option=orjson.OPT_SORT_KEYS))
+        except TypeError:
+            # 消息含orjson无法序列化的值时退回纯Python路径
+            fingerprint = hash(str(sorted(payload.items())))
+    else:
+        fingerprint = hash(str(sorted(payload.items())))
+    message['_msg_fingerprint'] = fingerprint
+    return fingerprint
+
+
+def _iter_string_leaves(obj):
+    """迭代遍历嵌套dict/list中的所有字符串叶子节点
+
+    显式栈实现，避免把整个消息repr成一个大字符串再搜索。
+    """
+    stack = deque([obj])
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            yield node
+        elif isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, (list, tuple)):
+            stack.extend(node)
+
+
+class _PendingMessageQueue:
+    """延迟处理消息队列：FIFO deque + 消息哈希倒排索引
+
+    哈希匹配从O(N)线性扫描降为O(1)字典探测；FIFO弹出时同步
+    从索引中摘除，保持两份结构一致。
+    """
+
+    __slots__ = ('_entries', '_by_hash')
+
+    def __init__(self):
+        self._entries = deque()
+        self._by_hash = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def append(self, entry: dict):
+        self._entries.append(entry)
+        self._by_hash.setdefault(entry.get('message_hash'), deque()).append(entry)
+
+    def pop_by_hash(self, message_hash) -> Optional[dict]:
+        """按消息哈希弹出最近入队的一条，无匹配返回None"""
+        bucket = self._by_hash.get(message_hash)
+        if not bucket:
+            return None
+        # 取最近入队的一条，与原先从队尾向前扫描的语义一致
+        entry = bucket.pop()
+        if not bucket:
+            del self._by_hash[message_hash]
+        # 只有命中时才付出O(N)的摘除成本
+        self._entries.remove(entry)
+        return entry
+
+    def popleft(self) -> dict:
+        """FIFO弹出队首，并从哈希索引中摘除"""
+        entry = self._entries.popleft()
+        message_hash = entry.get('message_hash')
+        bucket = self._by_hash.get(message_hash)
+        if bucket:
+            try:
+                bucket.remove(entry)
+            except ValueError:
+                pass
+            if not bucket:
+                del self._by_hash[message_hash]
+        return entry
+
+    def expire_before(self, cutoff: float) -> int:
+        """从队首弹出时间戳早于cutoff的过期条目，返回条数
+
+        条目按入队时间递增，过期的必然聚在队首，
+        只触碰真正过期的条目而非整队重建。
+        """
+        removed = 0
+        while self._entries and self._entries[0].get('timestamp', 0) < cutoff:
+            self.popleft()
+            removed += 1
+        return removed
+
 
 class OrderStatusHandler:
     """订单状态处理器"""
@@ -33,14 +337,15 @@ class OrderStatusHandler:
     # 3. 退款中的订单或者退货中的订单设置为退款中
     # 4. 退款中的订单可以设置为已完成（因为买家可能取消退款）
     # 5. 只有退款完成才设置为已关闭
+    # 值使用frozenset，成员判断为O(1)哈希探测
     VALID_TRANSITIONS = {
-        'processing': ['pending_ship', 'shipped', 'completed', 'cancelled'],
-        'pending_ship': ['shipped', 'completed', 'cancelled', 'refunding'],  # 已付款，可以退款
-        'shipped': ['completed', 'cancelled', 'refunding'],  # 已发货，可以退款
-        'completed': ['cancelled', 'refunding'],  # 已完成，可以退款
-        'refunding': ['completed', 'cancelled', 'refund_cancelled'],  # 退款中，可以完成（取消退款）、关闭（退款完成）或撤销
-        'refund_cancelled': [],  # 退款撤销（临时状态，会立即回退到上一次状态）
-        'cancelled': []  # 已关闭，不能转换到其他状态
+        'processing': frozenset({'pending_ship', 'shipped', 'completed', 'cancelled'}),
+        'pending_ship': frozenset({'shipped', 'completed', 'cancelled', 'refunding'}),  # 已付款，可以退款
+        'shipped': frozenset({'completed', 'cancelled', 'refunding'}),  # 已发货，可以退款
+        'completed': frozenset({'cancelled', 'refunding'}),  # 已完成，可以退款
+        'refunding': frozenset({'completed', 'cancelled', 'refund_cancelled'}),  # 退款中，可以完成（取消退款）、关闭（退款完成）或撤销
+        'refund_cancelled': frozenset(),  # 退款撤销（临时状态，会立即回退到上一次状态）
+        'cancelled': frozenset()  # 已关闭，不能转换到其他状态
     }
     
     def __init__(self):
@@ -58,18 +363,37 @@ class OrderStatusHandler:
             'cancelled': '已关闭',      # 交易关闭
         }
         
-        # 待处理的订单状态更新队列 {order_id: [update_info, ...]}
+        # 待处理的订单状态更新队列 {order_id: deque([update_info, ...])}
         self.pending_updates = {}
-        # 待处理的系统消息队列（用于延迟处理）{cookie_id: [message_info, ...]}
+        # 读路径使用的只读快照：变更方在临界区末尾整体替换（写时复制），
+        # 计数/存在性检查无需加锁
+        self._pending_updates_snap = {}
+        # 最近一次成功写入的状态 {order_id: status}，按LRU淘汰
+        # 重复的同状态通知在进入DB读写路径前直接短路
+        self._last_applied_status = OrderedDict()
+        self._last_applied_status_max_size = 10000
+        # 生产者侧无锁进队缓冲：CPython的deque.append是原子操作，
+        # 热路径只追加，消费端读取前统一折叠进pending_updates
+        self._pending_intake = deque()
+        # 过期候选最小堆 (timestamp, kind, key)：kind 0=pending_updates按订单，
+        # 1=系统消息按账号，2=红色提醒按账号。清理时只弹出真正到期的候选，
+        # 不再全量扫描所有队列；条目指向的键可能已被处理，弹出时容忍失效
+        self._expiry_heap = []
+        # 待处理的系统消息队列（用于延迟处理）{cookie_id: _PendingMessageQueue}
         self._pending_system_messages = {}
-        # 待处理的红色提醒消息队列（用于延迟处理）{cookie_id: [message_info, ...]}
+        # 待处理的红色提醒消息队列（用于延迟处理）{cookie_id: _PendingMessageQueue}
         self._pending_red_reminder_messages = {}
         
-        # 订单状态历史记录 {order_id: [status_history, ...]}
-        # 用于退款撤销时回退到上一次状态
+        # 订单状态历史记录 {order_id: deque(maxlen=10)}
+        # 用于退款撤销时回退到上一次状态；deque自动淘汰最旧记录，
+        # 冷订单由clear_old_pending_updates按最后写入时间整体清除
         self._order_status_history = {}
         # 聊天标识与订单ID映射（用于无法直接提取订单ID的系统消息）
-        self._chat_order_map: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # 每个账号一个OrderedDict，按LRU语义淘汰，过期项在查找时惰性清理
+        self._chat_order_map: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        # 读路径使用的不可变快照：写入端构建新dict后整体替换（写时复制），
+        # 读取端只做一次属性加载，无需加锁
+        self._chat_order_map_snapshot: Dict[str, Dict[str, Dict[str, Any]]] = {}
         self._chat_order_map_ttl = 48 * 3600  # 映射有效期（秒）
         self._chat_order_map_max_size = 200    # 单账号映射数量上限，防止内存膨胀
         
@@ -77,6 +401,9 @@ class OrderStatusHandler:
         # 注意：虽然在async环境中asyncio.Lock更理想，但本类的所有方法都是同步的
         # 且被同步代码调用，因此保持使用threading.RLock是合适的
         self._lock = threading.RLock()
+        # 聊天映射按账号分锁，不同账号的读写互不阻塞；
+        # 全局_lock仅用于锁字典本身的懒创建
+        self._cookie_locks: Dict[str, threading.Lock] = {}
         
         # 设置日志级别
         log_level = self.config.get('log_level', 'info')
@@ -87,107 +414,85 @@ class OrderStatusHandler:
         try:
             order_id = None
             
-            # 先查看消息的完整结构
-            logger.info(f"🔍 完整消息结构: {message}")
-            
+            # 结构转储只在DEBUG级别输出，且惰性求值，避免热路径上的repr开销
+            logger.opt(lazy=True).debug("🔍 完整消息结构: {}", lambda: repr(message))
+
             # 检查message['1']的结构，处理可能是列表、字典或字符串的情况
             message_1 = message.get('1', {})
             content_json_str = ''
-            
+
             if isinstance(message_1, dict):
-                logger.info(f"🔍 message['1'] 是字典，keys: {list(message_1.keys())}")
-                
+                logger.opt(lazy=True).debug("🔍 message['1'] 是字典，keys: {}", lambda: list(message_1.keys()))
+
                 # 检查message['1']['6']的结构
                 message_1_6 = message_1.get('6', {})
                 if isinstance(message_1_6, dict):
-                    logger.info(f"🔍 message['1']['6'] 是字典，keys: {list(message_1_6.keys())}")
                     # 方法1: 从button的targetUrl中提取orderId
-                    content_json_str = message_1_6.get('3', {}).get('5', '') if isinstance(message_1_6.get('3', {}), dict) else ''
+                    content_json_str = _dig(message_1_6, '3', '5', default='')
                 else:
-                    logger.info(f"🔍 message['1']['6'] 不是字典: {type(message_1_6)}")
-            
-            elif isinstance(message_1, list):
-                logger.info(f"🔍 message['1'] 是列表，长度: {len(message_1)}")
-                # 如果message['1']是列表，跳过这种提取方式
-            
-            elif isinstance(message_1, str):
-                logger.info(f"🔍 message['1'] 是字符串，长度: {len(message_1)}")
-                # 如果message['1']是字符串，跳过这种提取方式
-            
+                    logger.debug("🔍 message['1']['6'] 不是字典: {}", type(message_1_6))
             else:
-                logger.info(f"🔍 message['1'] 未知类型: {type(message_1)}")
-                # 其他类型，跳过这种提取方式
+                # 列表/字符串/其他类型均跳过这种提取方式
+                logger.debug("🔍 message['1'] 非字典类型: {}", type(message_1))
             
+            # 内容JSON只解析一次，方法1a/1b/2共用解析结果
+            content_data = None
             if content_json_str:
                 try:
                     content_data = json.loads(content_json_str)
-                    
-                    # 方法1a: 从button的targetUrl中提取orderId
-                    target_url = content_data.get('dxCard', {}).get('item', {}).get('main', {}).get('exContent', {}).get('button', {}).get('targetUrl', '')
-                    if target_url:
-                        # 从URL中提取orderId参数
-                        order_match = re.search(r'orderId=(\d+)', target_url)
-                        if order_match:
-                            order_id = order_match.group(1)
-                            logger.info(f'✅ 从button提取到订单ID: {order_id}')
-                    
-                    # 方法1b: 从main的targetUrl中提取order_detail的id
-                    if not order_id:
-                        main_target_url = content_data.get('dxCard', {}).get('item', {}).get('main', {}).get('targetUrl', '')
-                        if main_target_url:
-                            order_match = re.search(r'order_detail\?id=(\d+)', main_target_url)
-                            if order_match:
-                                order_id = order_match.group(1)
-                                logger.info(f'✅ 从main targetUrl提取到订单ID: {order_id}')
-                
                 except Exception as parse_e:
                     logger.error(f"解析内容JSON失败: {parse_e}")
+
+            # 按真实消息中的命中频率排列，命中即返回，不再继续走后续分支
+            if content_data is not None:
+                # 方法1a: 从button的targetUrl中提取orderId（最常见）
+                target_url = _dig(content_data, 'dxCard', 'item', 'main', 'exContent', 'button', 'targetUrl', default='')
+                if target_url:
+                    # 从URL中提取orderId参数
+                    order_match = _RE_ORDER_ID_URL.search(target_url)
+                    if order_match:
+                        order_id = order_match.group(1)
+                        logger.info(f'✅ 从button提取到订单ID: {order_id}')
+                        return order_id
+
+                # 方法1b: 从main的targetUrl中提取order_detail的id
+                main_target_url = _dig(content_data, 'dxCard', 'item', 'main', 'targetUrl', default='')
+                if main_target_url:
+                    order_match = _RE_ORDER_DETAIL.search(main_target_url)
+                    if order_match:
+                        order_id = order_match.group(1)
+                        logger.info(f'✅ 从main targetUrl提取到订单ID: {order_id}')
+                        return order_id
+
+                # 方法2: 从dynamicOperation中的order_detail URL提取orderId
+                dynamic_target_url = _dig(content_data, 'dynamicOperation', 'changeContent', 'dxCard', 'item', 'main', 'exContent', 'button', 'targetUrl', default='')
+                if dynamic_target_url:
+                    # 从order_detail URL中提取id参数
+                    order_match = _RE_ORDER_DETAIL.search(dynamic_target_url)
+                    if order_match:
+                        order_id = order_match.group(1)
+                        logger.info(f'✅ 从order_detail提取到订单ID: {order_id}')
+                        return order_id
             
-            # 方法2: 从dynamicOperation中的order_detail URL提取orderId
-            if not order_id and content_json_str:
-                try:
-                    content_data = json.loads(content_json_str)
-                    dynamic_target_url = content_data.get('dynamicOperation', {}).get('changeContent', {}).get('dxCard', {}).get('item', {}).get('main', {}).get('exContent', {}).get('button', {}).get('targetUrl', '')
-                    if dynamic_target_url:
-                        # 从order_detail URL中提取id参数
-                        order_match = re.search(r'order_detail\?id=(\d+)', dynamic_target_url)
-                        if order_match:
-                            order_id = order_match.group(1)
-                            logger.info(f'✅ 从order_detail提取到订单ID: {order_id}')
-                except Exception as parse_e:
-                    logger.error(f"解析dynamicOperation JSON失败: {parse_e}")
-            
-            # 方法3: 如果前面的方法都失败，尝试在整个消息中搜索订单ID模式
-            if not order_id:
-                try:
-                    # 将整个消息转换为字符串进行搜索
-                    message_str = str(message)
-                    
-                    # 搜索各种可能的订单ID模式
-                    patterns = [
-                        r'orderId[=:](\d{10,})',  # orderId=123456789 或 orderId:123456789
-                        r'order_detail\?id=(\d{10,})',  # order_detail?id=123456789
-                        r'"id"\s*:\s*"?(\d{10,})"?',  # "id":"123456789" 或 "id":123456789
-                        r'bizOrderId[=:](\d{10,})',  # bizOrderId=123456789
-                    ]
-                    
-                    for pattern in patterns:
-                        matches = re.findall(pattern, message_str)
-                        if matches:
-                            # 取第一个匹配的订单ID
-                            order_id = matches[0]
-                            logger.info(f'✅ 从消息字符串中提取到订单ID: {order_id} (模式: {pattern})')
-                            break
-                
-                except Exception as search_e:
-                    logger.error(f"在消息字符串中搜索订单ID失败: {search_e}")
-            
-            if order_id:
-                logger.info(f'🎯 最终提取到订单ID: {order_id}')
-            else:
-                logger.error(f'❌ 未能从消息中提取到订单ID')
-            
-            return order_id
+            # 方法3: 兜底，逐个扫描消息中的字符串叶子节点
+            # （不再把整个消息repr成大字符串，避免一次O(N)分配）
+            try:
+                for leaf in _iter_string_leaves(message):
+                    # 先做C层子串预检，再用合并后的交替正则单次扫描
+                    if not any(marker in leaf for marker in _ORDER_ID_MARKERS):
+                        continue
+                    match = _RE_ORDER_ID_FALLBACK.search(leaf)
+                    if match:
+                        # 取第一个非空分组作为订单ID
+                        order_id = next(group for group in match.groups() if group)
+                        logger.info(f'✅ 从消息字符串中提取到订单ID: {order_id}')
+                        return order_id
+
+            except Exception as search_e:
+                logger.error(f"在消息字符串中搜索订单ID失败: {search_e}")
+
+            logger.debug('❌ 未能从消息中提取到订单ID')
+            return None
         
         except Exception as e:
             logger.error(f"提取订单ID失败: {str(e)}")
@@ -205,111 +510,192 @@ class OrderStatusHandler:
         Returns:
             bool: 更新是否成功
         """
-        logger.info(f"🔄 订单状态处理器.update_order_status开始: order_id={order_id}, new_status={new_status}, cookie_id={cookie_id}, context={context}")
-        with self._lock:
-            try:
-                from db_manager import db_manager
-                
-                # 验证状态值是否有效
-                if new_status not in self.status_mapping:
-                    logger.error(f"❌ 无效的订单状态: {new_status}，有效状态: {list(self.status_mapping.keys())}")
-                    return False
-                
-                logger.info(f"✅ 订单状态验证通过: {new_status}")
-                
-                # 检查订单是否存在于数据库中（带重试机制）
-                current_order = None
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        logger.info(f"🔍 尝试获取订单信息 (尝试 {attempt + 1}/{max_retries}): {order_id}")
-                        current_order = db_manager.get_order_by_id(order_id)
-                        logger.info(f"✅ 订单信息获取成功: {order_id}")
-                        break
-                    except Exception as db_e:
-                        if attempt == max_retries - 1:
-                            logger.error(f"❌ 获取订单信息失败 (尝试 {attempt + 1}/{max_retries}): {str(db_e)}")
-                            return False
-                        else:
-                            logger.error(f"⚠️ 获取订单信息失败，重试中 (尝试 {attempt + 1}/{max_retries}): {str(db_e)}")
-                            time.sleep(0.1 * (attempt + 1))  # 递增延迟
-                
-                if not current_order:
-                    # 订单不存在，根据配置决定是否添加到待处理队列
-                    logger.info(f"⚠️ 订单 {order_id} 不存在于数据库中")
-                    if self.config.get('use_pending_queue', True):
-                        logger.info(f"📝 订单 {order_id} 不存在于数据库中，添加到待处理队列等待主程序拉取订单详情")
-                        self._add_to_pending_updates(order_id, new_status, cookie_id, context)
-                    else:
-                        logger.error(f"❌ 订单 {order_id} 不存在于数据库中且未启用待处理队列，跳过状态更新")
-                    return False
-                
-                current_status = current_order.get('order_status', 'processing')
-                logger.info(f"📊 当前订单状态: {current_status}, 目标状态: {new_status}")
-                
-                # 检查是否是相同的状态更新（避免重复处理）
-                if current_status == new_status:
+        # 数据库读写不持有_lock：锁只在内存结构的访问处
+        # （_add_to_pending_updates/_record_status_history内部各自加锁）
+        # 过程性日志合并为出口处一条结构化INFO，错误路径仍单独记ERROR
+        # 同状态的重复通知直接短路，不再走DB读写路径
+        if self._last_applied_status.get(order_id) == new_status:
+            logger.debug("⏭️ 订单 {} 状态 {} 与最近一次写入相同，跳过", order_id, new_status)
+            return True
+
+        try:
+            # 验证状态值是否有效
+            if new_status not in self.status_mapping:
+                logger.error(f"❌ 无效的订单状态: {new_status}，有效状态: {list(self.status_mapping.keys())}")
+                return False
+
+            # 检查订单是否存在于数据库中（带重试机制）
+            current_order = None
+            max_retries = 3
+            fetch_attempts = 0
+            for attempt in range(max_retries):
+                fetch_attempts = attempt + 1
+                try:
+                    current_order = db_manager.get_order_by_id(order_id)
+                    break
+                except sqlite3.OperationalError as db_e:
+                    # 仅对"database is locked"这类瞬态错误重试
+                    if attempt == max_retries - 1:
+                        logger.error(f"❌ 获取订单信息失败 (尝试 {attempt + 1}/{max_retries}): {str(db_e)}")
+                        return False
+                    time.sleep(0.01 * (1 << attempt) * (1 + random.random()))  # 指数退避+抖动
+
+            if not current_order:
+                # 订单不存在，根据配置决定是否添加到待处理队列
+                if self.config.get('use_pending_queue', True):
+                    self._add_to_pending_updates(order_id, new_status, cookie_id, context)
+                    logger.info(
+                        f"📝 update_order_status: order_id={order_id}, target={new_status}, "
+                        f"outcome=queued_pending, context={context}")
+                else:
+                    logger.error(f"❌ 订单 {order_id} 不存在于数据库中且未启用待处理队列，跳过状态更新")
+                return False
+
+            current_status = current_order.get('order_status', 'processing')
+
+            # 检查是否是相同的状态更新（避免重复处理）
+            if current_status == new_status:
+                self._remember_applied_status(order_id, new_status)
+                logger.info(
+                    f"⏭️ update_order_status: order_id={order_id}, status={new_status}, "
+                    f"outcome=no_change, context={context}")
+                return True  # 返回True表示"成功"，避免重复日志
+
+            # 检查状态转换是否合理（根据配置决定是否启用严格验证）
+            if self.config.get('strict_validation', True) and not self._is_valid_status_transition(current_status, new_status):
+                logger.error(f"❌ 订单 {order_id} 状态转换不合理: {current_status} -> {new_status} (严格验证已启用)")
+                logger.error(f"当前状态 '{current_status}' 允许转换到: {self._get_allowed_transitions(current_status)}")
+                return False
+
+            # 处理退款撤销的特殊逻辑
+            rollback = False
+            if new_status == 'refund_cancelled':
+                # 从历史记录中获取上一次状态
+                previous_status = self._get_previous_status(order_id)
+                if previous_status:
+                    new_status = previous_status
+                    rollback = True
+                else:
+                    logger.warning(f"⚠️ 退款撤销但无法获取上一次状态，保持当前状态: {current_status}")
+                    new_status = current_status
+
+            # 更新订单状态（带重试机制）
+            success = False
+            save_attempts = 0
+            for attempt in range(max_retries):
+                save_attempts = attempt + 1
+                try:
+                    success = db_manager.insert_or_update_order(
+                        order_id=order_id,
+                        order_status=new_status,
+                        cookie_id=cookie_id
+                    )
+                    break
+                except sqlite3.OperationalError as db_e:
+                    # 仅对"database is locked"这类瞬态错误重试
+                    if attempt == max_retries - 1:
+                        logger.error(f"❌ 更新订单状态失败 (尝试 {attempt + 1}/{max_retries}): {str(db_e)}")
+                        return False
+                    time.sleep(0.01 * (1 << attempt) * (1 + random.random()))  # 指数退避+抖动
+
+            if success:
+                # 记录状态历史（用于退款撤销时回退）
+                self._record_status_history(order_id, current_status, new_status, context)
+                self._remember_applied_status(order_id, new_status)
+
+                if self.config.get('enable_status_logging', True):
                     status_text = self.status_mapping.get(new_status, new_status)
-                    logger.info(f"⏭️ 订单 {order_id} 状态无变化，跳过重复更新: {status_text}")
-                    return True  # 返回True表示"成功"，避免重复日志
-                
-                # 检查状态转换是否合理（根据配置决定是否启用严格验证）
-                if self.config.get('strict_validation', True) and not self._is_valid_status_transition(current_status, new_status):
-                    logger.error(f"❌ 订单 {order_id} 状态转换不合理: {current_status} -> {new_status} (严格验证已启用)")
-                    logger.error(f"当前状态 '{current_status}' 允许转换到: {self._get_allowed_transitions(current_status)}")
-                    return False
-                
-                logger.info(f"✅ 状态转换验证通过: {current_status} -> {new_status}")
-                
-                # 处理退款撤销的特殊逻辑
-                if new_status == 'refund_cancelled':
-                    # 从历史记录中获取上一次状态
-                    previous_status = self._get_previous_status(order_id)
-                    if previous_status:
-                        logger.info(f"🔄 退款撤销，回退到上一次状态: {previous_status}")
-                        new_status = previous_status
-                    else:
-                        logger.warning(f"⚠️ 退款撤销但无法获取上一次状态，保持当前状态: {current_status}")
-                        new_status = current_status
-                
-                # 更新订单状态（带重试机制）
-                success = False
-                for attempt in range(max_retries):
-                    try:
-                        logger.info(f"💾 尝试更新订单状态 (尝试 {attempt + 1}/{max_retries}): {order_id}")
+                    logger.info(
+                        f"✅ update_order_status: order_id={order_id}, "
+                        f"from={current_status}, to={new_status}({status_text}), "
+                        f"attempts={fetch_attempts}+{save_attempts}, rollback={rollback}, "
+                        f"outcome=updated, context={context}")
+            else:
+                logger.error(f"❌ 订单状态更新失败: {order_id} -> {new_status} ({context})")
+
+            return success
+
+        except Exception as e:
+            logger.error(f"更新订单状态时出错: {str(e)}")
+            import traceback
+            logger.error(f"详细错误信息: {traceback.format_exc()}")
+            return False
+    
+    def update_order_statuses(self, updates: List[tuple]) -> Dict[str, bool]:
+        """批量更新订单状态：一次IN查询取当前状态，一个事务内写回
+
+        Args:
+            updates: [(order_id, new_status, cookie_id, context), ...]
+
+        Returns:
+            Dict[str, bool]: 每个订单的更新结果
+        """
+        if not updates:
+            return {}
+
+        results: Dict[str, bool] = {}
+        order_ids = [order_id for order_id, _, _, _ in updates]
+        current_orders = db_manager.get_orders_by_ids(order_ids)
+
+        # 先在纯内存里计算每个订单的目标状态（无I/O、无锁）
+        # 同一订单在批内的多次更新按顺序生效
+        to_apply = []
+        batch_status: Dict[str, str] = {}
+        for order_id, new_status, cookie_id, context in updates:
+            if new_status not in self.status_mapping:
+                logger.error(f"❌ 无效的订单状态: {new_status}，有效状态: {list(self.status_mapping.keys())}")
+                results[order_id] = False
+                continue
+
+            current_order = current_orders.get(order_id)
+            if not current_order:
+                if self.config.get('use_pending_queue', True):
+                    self._add_to_pending_updates(order_id, new_status, cookie_id, context)
+                results[order_id] = False
+                continue
+
+            current_status = batch_status.get(order_id) or current_order.get('order_status', 'processing')
+            if current_status == new_status:
+                results[order_id] = True  # 无变化视为成功，避免重复日志
+                continue
+
+            if self.config.get('strict_validation', True) and not self._is_valid_status_transition(current_status, new_status):
+                logger.error(f"❌ 订单 {order_id} 状态转换不合理: {current_status} -> {new_status} (严格验证已启用)")
+                results[order_id] = False
+                continue
+
+            if new_status == 'refund_cancelled':
+                previous_status = self._get_previous_status(order_id)
+                new_status = previous_status if previous_status else current_status
+
+            to_apply.append((order_id, current_status, new_status, cookie_id, context))
+            batch_status[order_id] = new_status
+
+        # 一个事务内批量写回，整体只落盘一次
+        if to_apply:
+            try:
+                with db_manager.atomic():
+                    for order_id, current_status, new_status, cookie_id, context in to_apply:
                         success = db_manager.insert_or_update_order(
                             order_id=order_id,
                             order_status=new_status,
                             cookie_id=cookie_id
                         )
-                        logger.info(f"✅ 订单状态更新成功: {order_id}")
-                        break
-                    except Exception as db_e:
-                        if attempt == max_retries - 1:
-                            logger.error(f"❌ 更新订单状态失败 (尝试 {attempt + 1}/{max_retries}): {str(db_e)}")
-                            return False
-                        else:
-                            logger.error(f"⚠️ 更新订单状态失败，重试中 (尝试 {attempt + 1}/{max_retries}): {str(db_e)}")
-                            time.sleep(0.1 * (attempt + 1))  # 递增延迟
-                
-                if success:
-                    # 记录状态历史（用于退款撤销时回退）
-                    self._record_status_history(order_id, current_status, new_status, context)
-                    
-                    status_text = self.status_mapping.get(new_status, new_status)
-                    if self.config.get('enable_status_logging', True):
-                        logger.info(f"✅ 订单状态更新成功: {order_id} -> {status_text} ({context})")
-                else:
-                    logger.error(f"❌ 订单状态更新失败: {order_id} -> {new_status} ({context})")
-                
-                return success
-                
+                        results[order_id] = bool(success)
+                        if success:
+                            self._record_status_history(order_id, current_status, new_status, context)
+                            self._remember_applied_status(order_id, new_status)
             except Exception as e:
-                logger.error(f"更新订单状态时出错: {str(e)}")
-                import traceback
-                logger.error(f"详细错误信息: {traceback.format_exc()}")
-                return False
-    
+                logger.error(f"批量更新订单状态失败: {e}")
+                for order_id, _, _, _, _ in to_apply:
+                    results.setdefault(order_id, False)
+
+            applied = [order_id for order_id, *_ in to_apply if results.get(order_id)]
+            if applied and self.config.get('enable_status_logging', True):
+                logger.info(f"✅ 批量订单状态更新完成: {len(applied)}/{len(to_apply)} 成功 {applied}")
+
+        return results
+
     def _is_valid_status_transition(self, current_status: str, new_status: str) -> bool:
         """检查状态转换是否合理
         
@@ -344,69 +730,80 @@ class OrderStatusHandler:
         """
         if current_status not in self.VALID_TRANSITIONS:
             return ['所有状态']  # 兼容性
-        
-        return self.VALID_TRANSITIONS.get(current_status, [])
-
-    def _normalize_identifier_values(self, value: Any) -> List[str]:
-        """标准化聊天相关的标识字符串，生成多个候选键"""
-        identifiers = set()
-        if value is None:
-            return []
 
-        try:
-            if isinstance(value, str):
-                normalized = value.strip()
-                if not normalized:
-                    return []
-                identifiers.add(normalized)
-                if '@' in normalized:
-                    identifiers.add(normalized.split('@')[0])
-                if normalized.endswith('.PNM'):
-                    identifiers.add(normalized.rsplit('.PNM', 1)[0])
-            elif isinstance(value, (int, float)):
-                identifiers.add(str(int(value)))
-        except Exception as e:
-            logger.debug(f"标准化聊天标识失败: {e}")
+        # 排序仅为日志/展示输出稳定
+        return sorted(self.VALID_TRANSITIONS.get(current_status, ()))
 
-        return [identifier for identifier in identifiers if identifier]
+    def _normalize_identifier_values(self, value: Any) -> Set[str]:
+        """标准化聊天相关的标识字符串，生成多个候选键
 
-    def _extract_chat_identifiers(self, message: dict) -> List[str]:
+        按类型显式分派，分支内不会抛异常，热路径上无需try/except。
+        """
+        identifiers = set()
+        if isinstance(value, str):
+            normalized = value.strip()
+            if not normalized:
+                return identifiers
+            identifiers.add(normalized)
+            if '@' in normalized:
+                identifiers.add(normalized.split('@')[0])
+            if normalized.endswith('.PNM'):
+                identifiers.add(normalized.rsplit('.PNM', 1)[0])
+        elif isinstance(value, (int, float)):
+            identifiers.add(str(int(value)))
+
+        identifiers.discard('')
+        return identifiers
+
+    def _extract_chat_identifiers(self, message: dict) -> Set[str]:
         """从消息中提取与聊天/会话相关的标识，用于订单ID匹配"""
-        if not isinstance(message, dict):
-            return []
         identifiers = set()
+        if not isinstance(message, dict):
+            return identifiers
 
-        try:
-            message_1 = message.get('1')
-            if isinstance(message_1, dict):
-                nested = message_1.get('1')
-                if isinstance(nested, dict):
-                    for key in ('1', '2', '3'):
-                        identifiers.update(self._normalize_identifier_values(nested.get(key)))
-
-                for key in ('2', '3', '4'):
-                    identifiers.update(self._normalize_identifier_values(message_1.get(key)))
-
-                message_10 = message_1.get('10')
-                if isinstance(message_10, dict):
-                    identifiers.update(self._normalize_identifier_values(message_10.get('senderUserId')))
-                    identifiers.update(self._normalize_identifier_values(message_10.get('receiver')))
-                    reminder_url = message_10.get('reminderUrl', '')
-                    if isinstance(reminder_url, str):
-                        for param in ('sid', 'itemId', 'bizOrderId', 'orderId', 'tradeId'):
-                            if f'{param}=' in reminder_url:
-                                value = reminder_url.split(f'{param}=')[1].split('&')[0]
-                                identifiers.update(self._normalize_identifier_values(value))
-            else:
-                identifiers.update(self._normalize_identifier_values(message_1))
+        # 各分支均先isinstance判定再取值，不会抛异常，省去外层try的帧级开销
+        message_1 = message.get('1')
+        if isinstance(message_1, dict):
+            nested = message_1.get('1')
+            if isinstance(nested, dict):
+                for key in ('1', '2', '3'):
+                    identifiers.update(self._normalize_identifier_values(nested.get(key)))
 
-            top_level_three = message.get('3')
-            if isinstance(top_level_three, (str, int)):
-                identifiers.update(self._normalize_identifier_values(top_level_three))
-        except Exception as e:
-            logger.debug(f"提取聊天标识失败: {e}")
+            for key in ('2', '3', '4'):
+                identifiers.update(self._normalize_identifier_values(message_1.get(key)))
 
-        return [identifier for identifier in identifiers if identifier]
+            message_10 = message_1.get('10')
+            if isinstance(message_10, dict):
+                identifiers.update(self._normalize_identifier_values(message_10.get('senderUserId')))
+                identifiers.update(self._normalize_identifier_values(message_10.get('receiver')))
+                reminder_url = message_10.get('reminderUrl', '')
+                if isinstance(reminder_url, str):
+                    for param in ('sid', 'itemId', 'bizOrderId', 'orderId', 'tradeId'):
+                        if f'{param}=' in reminder_url:
+                            value = reminder_url.split(f'{param}=')[1].split('&')[0]
+                            identifiers.update(self._normalize_identifier_values(value))
+        else:
+            identifiers.update(self._normalize_identifier_values(message_1))
+
+        top_level_three = message.get('3')
+        if isinstance(top_level_three, (str, int)):
+            identifiers.update(self._normalize_identifier_values(top_level_three))
+
+        identifiers.discard('')
+        return identifiers
+
+    def _lock_for(self, cookie_id: str) -> threading.Lock:
+        """获取指定账号的分片锁，懒创建
+
+        聊天映射与延迟消息队列按账号分锁，不同账号互不阻塞；
+        跨账号结构（pending_updates/过期堆/历史）仍由全局_lock保护。
+        锁序约定：账号锁在外、全局锁在内，不允许反向嵌套。
+        """
+        lock = self._cookie_locks.get(cookie_id)
+        if lock is None:
+            with self._lock:
+                lock = self._cookie_locks.setdefault(cookie_id, threading.Lock())
+        return lock
 
     def _store_chat_order_mapping(self, order_id: str, cookie_id: str, message: dict):
         """记录聊天标识与订单ID之间的映射关系"""
@@ -418,35 +815,24 @@ class OrderStatusHandler:
             return
 
         now = time.time()
-        with self._lock:
-            mapping = self._chat_order_map.setdefault(cookie_id, {})
-
-            # 清理过期的映射
-            expired_keys = [
-                key for key, entry in list(mapping.items())
-                if now - entry.get('timestamp', now) > self._chat_order_map_ttl
-            ]
-            for key in expired_keys:
-                mapping.pop(key, None)
-
-            # 控制映射数量，按时间顺序淘汰
-            if len(mapping) >= self._chat_order_map_max_size:
-                sorted_items = sorted(
-                    mapping.items(),
-                    key=lambda item: item[1].get('timestamp', 0)
-                )
-                overflow = max(0, len(mapping) + len(identifiers) - self._chat_order_map_max_size)
-                if overflow > 0:
-                    for key, _ in sorted_items[:overflow]:
-                        mapping.pop(key, None)
+        with self._lock_for(cookie_id):
+            mapping = self._chat_order_map.setdefault(cookie_id, OrderedDict())
 
+            # 插入/刷新映射，并移动到LRU末尾
             for identifier in identifiers:
                 mapping[identifier] = {'order_id': order_id, 'timestamp': now}
+                mapping.move_to_end(identifier)
+
+            # 超出上限时按LRU淘汰最旧的条目，O(1)均摊
+            while len(mapping) > self._chat_order_map_max_size:
+                mapping.popitem(last=False)
 
-            logger.debug(f"🧭 聊天映射记录: cookie={cookie_id}, keys={identifiers}, order_id={order_id}")
+            # 发布新的只读快照：只替换本账号自己的键（GIL下单次setitem
+            # 原子），不重建顶层dict——整体重建是跨账号的读改写，
+            # 两个账号并发发布会互相丢失对方的更新；读路径仍无锁
+            self._chat_order_map_snapshot[cookie_id] = dict(mapping)
 
-            if not mapping:
-                self._chat_order_map.pop(cookie_id, None)
+            logger.debug("🧭 聊天映射记录: cookie={}, keys={}, order_id={}", cookie_id, identifiers, order_id)
 
     def _lookup_order_id_by_message(self, message: dict, cookie_id: str) -> Optional[str]:
         """根据聊天标识查找之前记录的订单ID"""
@@ -457,62 +843,69 @@ class OrderStatusHandler:
         if not identifiers:
             return None
 
+        # 读路径完全无锁：只读取当前快照，过期项跳过（由写入端LRU淘汰）
         now = time.time()
-        with self._lock:
-            mapping = self._chat_order_map.get(cookie_id)
-            if not mapping:
-                return None
-
-            expired_keys = []
-            for identifier in identifiers:
-                entry = mapping.get(identifier)
-                if not entry:
-                    continue
-                if now - entry.get('timestamp', now) > self._chat_order_map_ttl:
-                    expired_keys.append(identifier)
-                    continue
-                order_id = entry.get('order_id')
-                if order_id:
-                    logger.info(f"🔁 根据聊天上下文匹配到订单ID: {order_id} (标识: {identifier})")
-                    return order_id
-
-            for key in expired_keys:
-                mapping.pop(key, None)
+        mapping = self._chat_order_map_snapshot.get(cookie_id)
+        if not mapping:
+            return None
 
-            if not mapping:
-                self._chat_order_map.pop(cookie_id, None)
+        # 集合交集一次性筛出命中的标识，避免逐个get未命中键
+        for identifier in identifiers & mapping.keys():
+            entry = mapping[identifier]
+            if now - entry.get('timestamp', now) > self._chat_order_map_ttl:
+                continue
+            order_id = entry.get('order_id')
+            if order_id:
+                # 命中时回写LRU顺序（低频，才需要拿写锁）
+                with self._lock_for(cookie_id):
+                    authoritative = self._chat_order_map.get(cookie_id)
+                    if authoritative and identifier in authoritative:
+                        authoritative.move_to_end(identifier)
+                logger.info(f"🔁 根据聊天上下文匹配到订单ID: {order_id} (标识: {identifier})")
+                return order_id
 
         return None
 
     def _extract_task_name(self, message: dict) -> Optional[str]:
-        """从系统消息中提取任务名称（taskName）"""
-        try:
-            if not isinstance(message, dict):
-                return None
+        """从系统消息中提取任务名称（taskName）
 
-            message_1 = message.get('1')
-            if not isinstance(message_1, dict):
-                return None
+        bizTag解析结果缓存在消息dict自身上（'_cached_biz_data'哨兵键），
+        同一条消息走多个检查路径时只解析一次JSON。
+        """
+        if not isinstance(message, dict):
+            return None
 
-            message_10 = message_1.get('10')
-            if not isinstance(message_10, dict):
-                return None
+        # 命中缓存则不再解析
+        cached = message.get('_cached_biz_data')
+        if cached is not None:
+            return cached.get('taskName') if isinstance(cached, dict) else None
 
-            biz_tag = message_10.get('bizTag')
-            if not biz_tag:
-                return None
+        message_1 = message.get('1')
+        if not isinstance(message_1, dict):
+            return None
 
+        message_10 = message_1.get('10')
+        if not isinstance(message_10, dict):
+            return None
+
+        biz_tag = message_10.get('bizTag')
+        if not biz_tag:
+            return None
+
+        # try只收窄到真正可能抛异常的JSON解析
+        if isinstance(biz_tag, str):
             try:
-                biz_data = json.loads(biz_tag) if isinstance(biz_tag, str) else biz_tag
-                task_name = biz_data.get('taskName')
-                return task_name
+                biz_data = json.loads(biz_tag)
             except Exception as parse_e:
-                logger.debug(f"解析bizTag失败: {parse_e}")
+                logger.debug("解析bizTag失败: {}", parse_e)
                 return None
+        else:
+            biz_data = biz_tag
 
-        except Exception as e:
-            logger.debug(f"提取taskName失败: {e}")
-            return None
+        if isinstance(biz_data, dict):
+            message['_cached_biz_data'] = biz_data
+            return biz_data.get('taskName')
+        return None
 
     def _infer_status_from_task_name(self, message: dict, send_message: str) -> Optional[str]:
         """根据任务名称推断状态"""
@@ -533,30 +926,26 @@ class OrderStatusHandler:
             return 'cancelled'
 
         # 退款成功/订单关闭
-        cancelled_keywords = ['退款成功', '退货成功', '退货退款成功', '退款退货成功', '关闭订单', '交易关闭', '退款已完成', '交易成功，有退款', '交易成功，已退款']
-        if any(keyword in task_name for keyword in cancelled_keywords):
+        if _RE_TASK_CANCELLED.search(task_name):
             logger.info(f"🔍 根据taskName推断订单关闭: {task_name}")
             return 'cancelled'
 
         # 交易完成/确认收货
-        completed_keywords = ['确认收货', '交易成功', '评价_卖家', '评价_买家', '期待评价']
-        if any(keyword in task_name for keyword in completed_keywords):
+        if _RE_TASK_COMPLETED.search(task_name):
             logger.info(f"🔍 根据taskName推断订单已完成: {task_name}")
             return 'completed'
 
         # 退款进行中
-        refunding_keywords = ['改为仅退款已同意', '发起退款申请', '申请退款', '退款处理中']
-        if any(keyword in task_name for keyword in refunding_keywords):
+        if _RE_TASK_REFUNDING.search(task_name):
             logger.info(f"🔍 根据taskName推断订单退款中: {task_name}")
             return 'refunding'
 
         # 退款撤销
-        refund_cancelled_keywords = ['退款申请已撤销', '退款申请已取消', '取消退款申请']
-        if any(keyword in task_name for keyword in refund_cancelled_keywords):
+        if _RE_TASK_REFUND_CANCELLED.search(task_name):
             logger.info(f"🔍 根据taskName推断退款撤销: {task_name}")
             return 'refund_cancelled'
 
-        logger.debug(f"⚪ taskName未匹配到状态: {task_name}")
+        logger.debug("⚪ taskName未匹配到状态: {}", task_name)
         return None
 
     def _infer_status_from_message(self, send_message: str, message: dict = None) -> Optional[str]:
@@ -571,48 +960,67 @@ class OrderStatusHandler:
         if not send_message:
             return self._infer_status_from_task_name(message, send_message)
 
-        normalized = send_message.strip()
-        # 去除中英文方括号以及空格
-        normalized = normalized.strip('[]').strip('【】').strip()
+        # 去除中英文方括号以及空格（单次translate遍历）
+        normalized = send_message.translate(_BRACKET_TRANS).strip()
+
+        # 可用时走Aho-Corasick：单次扫描取得全部命中桶，再按原优先级判定
+        if _MSG_AC is not None:
+            hits = set()
+            for _, tags in _MSG_AC.iter(normalized):
+                hits |= tags
+            if 'cancelled' in hits:
+                return 'cancelled'
+            if 'refunded' in hits and 'trade_result' in hits:
+                return 'cancelled'
+            if 'refund_request' in hits:
+                if 'agreed' in hits:
+                    return 'refunding'
+                if 'revoked' in hits:
+                    return 'refund_cancelled'
+            if 'pending_ship' in hits:
+                return 'pending_ship'
+            if 'shipped' in hits:
+                return 'shipped'
+            if 'evaluation' in hits or 'completed' in hits:
+                return 'completed'
+            if 'closed' in hits:
+                return 'cancelled'
+            return self._infer_status_from_task_name(message, send_message)
 
         # 退款/退货成功 → 订单关闭
-        if any(keyword in normalized for keyword in ['退款成功', '退货成功', '退货退款成功']) or \
-           any(keyword in normalized for keyword in ['钱款已原路退返', '钱款已退回', '款项已退回', '交易成功，已退款', '交易关闭，已退款']):
+        if _RE_MSG_CANCELLED.search(normalized):
             return 'cancelled'
 
         # 交易结果附带退款提示 → 订单关闭
-        if '已退款' in normalized and any(keyword in normalized for keyword in ['交易成功', '交易关闭']):
+        if '已退款' in normalized and _RE_MSG_TRADE_RESULT.search(normalized):
             return 'cancelled'
 
         # 同意退款/退货申请 → 退款中
-        if ('退款申请' in normalized or '退货申请' in normalized) and \
-           any(keyword in normalized for keyword in ['已同意', '同意了', '通过了', '同意退款', '同意退货']):
+        if _RE_MSG_REFUND_REQUEST.search(normalized) and _RE_MSG_AGREED.search(normalized):
             return 'refunding'
 
         # 撤销退款申请 → 退退款撤销（最终回退上一状态）
-        if ('退款申请' in normalized or '退货申请' in normalized) and \
-           any(keyword in normalized for keyword in ['已撤销', '撤销了', '取消了', '已取消']):
+        if _RE_MSG_REFUND_REQUEST.search(normalized) and _RE_MSG_REVOKED.search(normalized):
             return 'refund_cancelled'
 
         # 买家已付款 / 等待发货
-        if any(keyword in normalized for keyword in ['买家已付款', '付款完成', '已付款', '等待你发货', '待发货']):
+        if _RE_MSG_PENDING_SHIP.search(normalized):
             return 'pending_ship'
 
         # 卖家确认发货
-        if any(keyword in normalized for keyword in ['你已发货', '已发货', '等待买家确认收货']):
+        if _RE_MSG_SHIPPED.search(normalized):
             return 'shipped'
 
         # 交易完成后的评价提醒
-        evaluation_keywords = ['快给ta一个评价吧', '快给TA一个评价吧', '快给他一个评价吧', '快给她一个评价吧', '我完成了评价', '期待你的评价', '有新交易评价', '有新的交易评价']
-        if any(keyword in normalized for keyword in evaluation_keywords):
+        if _RE_MSG_EVALUATION.search(normalized):
             return 'completed'
 
         # 交易完成
-        if any(keyword in normalized for keyword in ['确认收货', '交易成功']):
+        if _RE_MSG_COMPLETED.search(normalized):
             return 'completed'
 
         # 交易关闭
-        if '交易关闭' in normalized or '关闭了订单' in normalized:
+        if _RE_MSG_CLOSED.search(normalized):
             return 'cancelled'
 
         # 最后尝试根据taskName判断
@@ -640,7 +1048,7 @@ class OrderStatusHandler:
                 return None
             
             # 解析JSON内容
-            content_json_str = message_1_6.get('3', {}).get('5', '') if isinstance(message_1_6.get('3', {}), dict) else ''
+            content_json_str = _dig(message_1_6, '3', '5', default='')
             if not content_json_str:
                 return None
             
@@ -657,25 +1065,29 @@ class OrderStatusHandler:
                         tip_content = tip_field
 
                 if tip_content:
-                    normalized_tip = tip_content.strip().strip('[]【】')
+                    normalized_tip = tip_content.translate(_BRACKET_TRANS).strip()
                     logger.info(f"🔍 检查退款Tip消息: '{normalized_tip}'")
 
-                    if any(keyword in normalized_tip for keyword in ['退款成功', '钱款已原路退返', '钱款已退回', '退款已完成', '交易关闭，已退款', '交易成功，已退款', '交易成功，有退款']):
+                    if _RE_REFUND_SUCCESS.search(normalized_tip):
                         logger.info("✅ 识别到退款成功提示消息")
                         return 'cancelled'
 
-                    if ('退款申请' in normalized_tip or '退货申请' in normalized_tip) and any(keyword in normalized_tip for keyword in ['已同意', '同意', '处理中']):
+                    if _RE_REFUND_APPLY.search(normalized_tip) and _RE_REFUND_HANDLING_TIP.search(normalized_tip):
                         logger.info("ℹ️ 识别到退款处理中提示消息")
                         return 'refunding'
 
                 # 2) dynamicOperation 卡片消息（例如“我发起了退款申请”）
-                dynamic_content = content_data.get('dynamicOperation', {}).get('changeContent', {})
-                if dynamic_content:
-                    dx_card = dynamic_content.get('dxCard', {}).get('item', {}).get('main', {})
-                    ex_content = dx_card.get('exContent', {}) if isinstance(dx_card, dict) else {}
-
-                    title = ex_content.get('title', '') if isinstance(ex_content, dict) else ''
-                    button_text = ex_content.get('button', {}).get('text', '') if isinstance(ex_content.get('button', {}), dict) else ex_content.get('button', '') if isinstance(ex_content.get('button', {}), str) else ''
+                ex_content = _dig(content_data, 'dynamicOperation', 'changeContent',
+                                  'dxCard', 'item', 'main', 'exContent')
+                if isinstance(ex_content, dict):
+                    title = ex_content.get('title', '')
+                    button = ex_content.get('button')
+                    if isinstance(button, dict):
+                        button_text = button.get('text', '')
+                    elif isinstance(button, str):
+                        button_text = button
+                    else:
+                        button_text = ''
 
                     if title or button_text:
                         logger.info(f"🔍 检查退款消息 - 标题: '{title}', 按钮: '{button_text}'")
@@ -690,7 +1102,7 @@ class OrderStatusHandler:
 
                     if title and '退款' in title and button_text in ('已同意', '同意退款'):
                         task_name = self._extract_task_name(message) or ''
-                        if task_name and any(keyword in task_name for keyword in ['退货', '退货退款']):
+                        if task_name and _RE_RETURN_TASK.search(task_name):
                             logger.info("ℹ️ 识别到退货相关退款申请已同意消息，保持退款中")
                             return 'refunding'
 
@@ -698,32 +1110,38 @@ class OrderStatusHandler:
                         return 'cancelled'
 
                 # 3) 兜底：detailNotice / reminderContent 中可能直接包含提示
-                detail_notice = message.get('10', {}).get('detailNotice') if isinstance(message.get('10'), dict) else ''
-                reminder_content = message.get('10', {}).get('reminderContent') if isinstance(message.get('10'), dict) else ''
-
-                for extra_text in filter(None, [detail_notice, reminder_content]):
-                    normalized_extra = str(extra_text).strip().strip('[]【】')
-                    if not normalized_extra:
-                        continue
+                # 归一化结果缓存在消息dict自身上，同一条消息重走该路径时不再重建
+                normalized_extras = message.get('_normalized_extras')
+                if normalized_extras is None:
+                    detail_notice = _dig(message, '10', 'detailNotice', default='')
+                    reminder_content = _dig(message, '10', 'reminderContent', default='')
+                    normalized_extras = [
+                        normalized for normalized in (
+                            str(extra_text).translate(_BRACKET_TRANS).strip()
+                            for extra_text in filter(None, [detail_notice, reminder_content])
+                        ) if normalized
+                    ]
+                    message['_normalized_extras'] = normalized_extras
 
+                for normalized_extra in normalized_extras:
                     logger.info(f"🔍 检查退款提示文本: '{normalized_extra}'")
 
-                    if any(keyword in normalized_extra for keyword in ['退款成功', '钱款已原路退返', '钱款已退回', '退款已完成', '交易关闭，已退款', '交易成功，已退款', '交易成功，有退款']):
+                    if _RE_REFUND_SUCCESS.search(normalized_extra):
                         logger.info("✅ 识别到退款成功提示文本")
                         return 'cancelled'
 
-                    if ('退款申请' in normalized_extra or '退货申请' in normalized_extra) and any(keyword in normalized_extra for keyword in ['已同意', '处理中', '待处理']):
+                    if _RE_REFUND_APPLY.search(normalized_extra) and _RE_REFUND_HANDLING_EXTRA.search(normalized_extra):
                         logger.info("ℹ️ 识别到退款处理中提示文本")
                         return 'refunding'
 
             except Exception as parse_e:
-                logger.debug(f"解析退款消息JSON失败: {parse_e}")
+                logger.debug("解析退款消息JSON失败: {}", parse_e)
                 return None
             
             return None
             
         except Exception as e:
-            logger.debug(f"检查退款消息失败: {e}")
+            logger.debug("检查退款消息失败: {}", e)
             return None
     
     def _record_status_history(self, order_id: str, from_status: str, to_status: str, context: str):
@@ -735,25 +1153,25 @@ class OrderStatusHandler:
             to_status: 新状态
             context: 上下文信息
         """
+        # 只记录非临时状态的历史（排除 refund_cancelled）
+        if to_status == 'refund_cancelled':
+            return
+
         with self._lock:
-            if order_id not in self._order_status_history:
-                self._order_status_history[order_id] = []
-            
-            # 只记录非临时状态的历史（排除 refund_cancelled）
-            if to_status != 'refund_cancelled':
-                history_entry = {
-                    'from_status': from_status,
-                    'to_status': to_status,
-                    'context': context,
-                    'timestamp': time.time()
-                }
-                self._order_status_history[order_id].append(history_entry)
-                
-                # 限制历史记录数量，只保留最近10条
-                if len(self._order_status_history[order_id]) > 10:
-                    self._order_status_history[order_id] = self._order_status_history[order_id][-10:]
-                
-                logger.debug(f"📝 记录订单状态历史: {order_id} {from_status} -> {to_status}")
+            history = self._order_status_history.get(order_id)
+            if history is None:
+                # maxlen=10：追加O(1)，超限自动淘汰最旧记录，无切片重建
+                history = deque(maxlen=10)
+                self._order_status_history[order_id] = history
+
+            history.append({
+                'from_status': from_status,
+                'to_status': to_status,
+                'context': context,
+                'timestamp': time.time()
+            })
+
+            logger.debug("📝 记录订单状态历史: {} {} -> {}", order_id, from_status, to_status)
     
     def _get_previous_status(self, order_id: str) -> Optional[str]:
         """获取订单的上一次状态（用于退款撤销时回退）
@@ -764,14 +1182,32 @@ class OrderStatusHandler:
         Returns:
             str: 上一次状态，如果没有历史记录则返回None
         """
-        with self._lock:
-            if order_id not in self._order_status_history or not self._order_status_history[order_id]:
-                return None
-            
+        # 无锁读：dict.get与deque尾部读取在GIL下各自原子，
+        # 与并发append竞争时读到新旧任一末尾记录都是正确结果
+        history = self._order_status_history.get(order_id)
+        if not history:
+            return None
+
+        try:
             # 获取最后一次状态变化的目标状态
-            last_entry = self._order_status_history[order_id][-1]
-            return last_entry['to_status']
+            return history[-1]['to_status']
+        except IndexError:
+            return None
     
+    def _remember_applied_status(self, order_id: str, status: str):
+        """记录最近一次成功写入的状态，供重复通知短路
+
+        Args:
+            order_id: 订单ID
+            status: 已写入的状态
+        """
+        with self._lock:
+            cache = self._last_applied_status
+            cache[order_id] = status
+            cache.move_to_end(order_id)
+            while len(cache) > self._last_applied_status_max_size:
+                cache.popitem(last=False)
+
     def _add_to_pending_updates(self, order_id: str, new_status: str, cookie_id: str, context: str):
         """添加到待处理更新队列
         
@@ -781,76 +1217,120 @@ class OrderStatusHandler:
             cookie_id: Cookie ID
             context: 上下文信息
         """
+        update_info = {
+            'new_status': new_status,
+            'cookie_id': cookie_id,
+            'context': context,
+            'timestamp': time.time()
+        }
+
+        # 生产路径不加锁：deque.append原子，批量折叠交给消费端
+        self._pending_intake.append((order_id, update_info))
+        logger.info(f"订单 {order_id} 状态更新已添加到待处理队列: {new_status} ({context})")
+
+    def _drain_pending_intake(self):
+        """把无锁进队缓冲折叠进按订单分组的pending_updates
+
+        所有读取pending_updates的入口先调用本方法，保证可见性。
+        """
+        if not self._pending_intake:
+            return
+
+        with self._lock:
+            while True:
+                try:
+                    order_id, update_info = self._pending_intake.popleft()
+                except IndexError:
+                    break
+                self.pending_updates.setdefault(order_id, deque()).append(update_info)
+                heapq.heappush(self._expiry_heap, (update_info['timestamp'], 0, order_id))
+
+            # 数量上限兜底：超出时淘汰最早入队的订单（dict保持插入序），
+            # 时间维度的过期仍由最小堆清理负责
+            max_pending = self.config.get('max_pending_orders', 10000)
+            while len(self.pending_updates) > max_pending:
+                evicted_id = next(iter(self.pending_updates))
+                del self.pending_updates[evicted_id]
+                logger.warning(f"待处理队列超出上限 {max_pending}，淘汰最旧订单: {evicted_id}")
+
+            self._publish_pending_snapshot()
+
+    def _publish_pending_snapshot(self):
+        """发布pending_updates的只读快照，须在持有_lock时调用
+
+        读取端（计数、存在性预判）做一次属性加载即可，无需加锁。
+        """
+        self._pending_updates_snap = dict(self.pending_updates)
+
+    def _drain_pending_updates(self, order_id: str = None) -> list:
+        """在单个临界区内取走待处理更新
+
+        Args:
+            order_id: 指定订单ID，None表示取走全部
+
+        Returns:
+            list: [(order_id, updates), ...]，取走后队列中不再保留
+        """
+        # 快照预判：指定订单不存在且缓冲为空时直接返回，不进临界区
+        if order_id is not None and not self._pending_intake \
+                and order_id not in self._pending_updates_snap:
+            return []
+
+        self._drain_pending_intake()
         with self._lock:
-            if order_id not in self.pending_updates:
-                self.pending_updates[order_id] = []
-            
-            update_info = {
-                'new_status': new_status,
-                'cookie_id': cookie_id,
-                'context': context,
-                'timestamp': time.time()
-            }
-            
-            self.pending_updates[order_id].append(update_info)
-            logger.info(f"订单 {order_id} 状态更新已添加到待处理队列: {new_status} ({context})")
-    
+            if order_id is not None:
+                updates = self.pending_updates.pop(order_id, None)
+                if updates:
+                    self._publish_pending_snapshot()
+                    return [(order_id, updates)]
+                return []
+
+            drained = list(self.pending_updates.items())
+            self.pending_updates.clear()
+            self._publish_pending_snapshot()
+            return drained
+
     def process_pending_updates(self, order_id: str) -> bool:
         """处理指定订单的待处理更新
-        
+
         Args:
             order_id: 订单ID
-            
+
         Returns:
             bool: 是否有更新被处理
         """
-        with self._lock:
-            if order_id not in self.pending_updates:
-                return False
-            
-            updates = self.pending_updates.pop(order_id)
-            processed_count = 0
-        
-        for update_info in updates:
-            try:
-                success = self.update_order_status(
-                    order_id=order_id,
-                    new_status=update_info['new_status'],
-                    cookie_id=update_info['cookie_id'],
-                    context=f"待处理队列: {update_info['context']}"
-                )
-                
-                if success:
-                    processed_count += 1
-                    logger.info(f"处理待处理更新成功: 订单 {order_id} -> {update_info['new_status']}")
-                else:
-                    logger.error(f"处理待处理更新失败: 订单 {order_id} -> {update_info['new_status']}")
-                    
-            except Exception as e:
-                logger.error(f"处理待处理更新时出错: {str(e)}")
-        
-        if processed_count > 0:
-            logger.info(f"订单 {order_id} 共处理了 {processed_count} 个待处理状态更新")
-        
+        drained = self._drain_pending_updates(order_id)
+        if not drained:
+            return False
+
+        processed_count = self._apply_pending_updates_batch(order_id, drained[0][1])
         return processed_count > 0
-    
+
     def process_all_pending_updates(self) -> int:
         """处理所有待处理的更新
-        
+
         Returns:
             int: 处理的订单数量
         """
-        with self._lock:
-            if not self.pending_updates:
-                return 0
-            
-            order_ids = list(self.pending_updates.keys())
-            processed_orders = 0
-        
-        for order_id in order_ids:
-            if self.process_pending_updates(order_id):
-                processed_orders += 1
-        
+        # 一次临界区取走全部，所有订单合并为一个批次，
+        # update_order_statuses在单个事务内写回，整次冲刷只落盘一次
+        drained = self._drain_pending_updates()
+        if not drained:
+            return 0
+
+        batch = []
+        for order_id, updates in drained:
+            batch.extend(
+                (order_id, update_info['new_status'], update_info['cookie_id'],
+                 f"待处理队列: {update_info['context']}")
+                for update_info in updates
+            )
+
+        results = self.update_order_statuses(batch)
+        processed_orders = sum(1 for order_id, _ in drained if results.get(order_id))
+        if processed_orders:
+            logger.info(f"批量处理待处理更新完成: {processed_orders}/{len(drained)} 个订单")
+
         return processed_orders
     
     def get_pending_updates_count(self) -> int:
@@ -859,8 +1339,9 @@ class OrderStatusHandler:
         Returns:
             int: 待处理更新的数量
         """
-        with self._lock:
-            return len(self.pending_updates)
+        # 折叠缓冲后读快照即可，空缓冲时全程无锁
+        self._drain_pending_intake()
+        return len(self._pending_updates_snap)
     
     def clear_old_pending_updates(self, max_age_hours: int = None):
         """清理过期的待处理更新
@@ -878,67 +1359,79 @@ class OrderStatusHandler:
         
         current_time = time.time()
         max_age_seconds = max_age_hours * 3600
-        
+
+        self._drain_pending_intake()
+        cutoff = current_time - max_age_seconds
+        expired_orders = []
+        expired_cookies_system = []
+        expired_cookies_red = []
+        due_cookies_system = set()
+        due_cookies_red = set()
+
         with self._lock:
-            # 清理 pending_updates
-            expired_orders = []
-            for order_id, updates in self.pending_updates.items():
-                # 过滤掉过期的更新
-                valid_updates = [
-                    update for update in updates 
-                    if current_time - update['timestamp'] < max_age_seconds
-                ]
-                
-                if not valid_updates:
-                    expired_orders.append(order_id)
+            # 只弹出真正到期的堆顶候选，不再全量扫描所有队列；
+            # 同一键可能有多个候选，对应队列/键已被处理时直接跳过
+            heap = self._expiry_heap
+
+            while heap and heap[0][0] < cutoff:
+                _, kind, key = heapq.heappop(heap)
+
+                if kind == 0:
+                    updates = self.pending_updates.get(key)
+                    if updates is None:
+                        continue
+                    while updates and updates[0]['timestamp'] < cutoff:
+                        updates.popleft()
+                    if not updates:
+                        del self.pending_updates[key]
+                        expired_orders.append(key)
+                        logger.info(f"清理过期的待处理更新: 订单 {key}")
+                elif kind == 1:
+                    due_cookies_system.add(key)
                 else:
-                    self.pending_updates[order_id] = valid_updates
-            
-            # 移除完全过期的订单
-            for order_id in expired_orders:
-                del self.pending_updates[order_id]
-                logger.info(f"清理过期的待处理更新: 订单 {order_id}")
-            
+                    due_cookies_red.add(key)
+
             if expired_orders:
+                self._publish_pending_snapshot()
                 logger.info(f"共清理了 {len(expired_orders)} 个过期的待处理订单更新")
-            
-            # 清理 _pending_system_messages
-            expired_cookies_system = []
-            for cookie_id, messages in self._pending_system_messages.items():
-                valid_messages = [
-                    msg for msg in messages 
-                    if current_time - msg.get('timestamp', 0) < max_age_seconds
-                ]
-                
-                if not valid_messages:
+
+            # 清理长期无状态变化的订单历史，防止dict无界增长
+            stale_history = [
+                history_order_id
+                for history_order_id, history in self._order_status_history.items()
+                if not history or history[-1]['timestamp'] < cutoff
+            ]
+            for history_order_id in stale_history:
+                del self._order_status_history[history_order_id]
+            if stale_history:
+                logger.info(f"清理了 {len(stale_history)} 个冷订单的状态历史")
+
+        # 消息队列按账号分锁，遵循"账号锁在外"的锁序，在全局锁外处理
+        for cookie_id in due_cookies_system:
+            with self._lock_for(cookie_id):
+                queue = self._pending_system_messages.get(cookie_id)
+                if queue is None:
+                    continue
+                queue.expire_before(cutoff)
+                if not queue:
+                    del self._pending_system_messages[cookie_id]
                     expired_cookies_system.append(cookie_id)
-                else:
-                    self._pending_system_messages[cookie_id] = valid_messages
-            
-            for cookie_id in expired_cookies_system:
-                del self._pending_system_messages[cookie_id]
-                logger.info(f"清理过期的待处理系统消息: 账号 {cookie_id}")
-            
-            # 清理 _pending_red_reminder_messages
-            expired_cookies_red = []
-            for cookie_id, messages in self._pending_red_reminder_messages.items():
-                valid_messages = [
-                    msg for msg in messages 
-                    if current_time - msg.get('timestamp', 0) < max_age_seconds
-                ]
-                
-                if not valid_messages:
+                    logger.info(f"清理过期的待处理系统消息: 账号 {cookie_id}")
+
+        for cookie_id in due_cookies_red:
+            with self._lock_for(cookie_id):
+                queue = self._pending_red_reminder_messages.get(cookie_id)
+                if queue is None:
+                    continue
+                queue.expire_before(cutoff)
+                if not queue:
+                    del self._pending_red_reminder_messages[cookie_id]
                     expired_cookies_red.append(cookie_id)
-                else:
-                    self._pending_red_reminder_messages[cookie_id] = valid_messages
-            
-            for cookie_id in expired_cookies_red:
-                del self._pending_red_reminder_messages[cookie_id]
-                logger.info(f"清理过期的待处理红色提醒消息: 账号 {cookie_id}")
-            
-            total_cleared = len(expired_orders) + len(expired_cookies_system) + len(expired_cookies_red)
-            if total_cleared > 0:
-                logger.info(f"内存清理完成，共清理了 {total_cleared} 个过期项目")
+                    logger.info(f"清理过期的待处理红色提醒消息: 账号 {cookie_id}")
+
+        total_cleared = len(expired_orders) + len(expired_cookies_system) + len(expired_cookies_red)
+        if total_cleared > 0:
+            logger.info(f"内存清理完成，共清理了 {total_cleared} 个过期项目")
     
     def handle_system_message(self, message: dict, send_message: str, cookie_id: str, msg_time: str) -> bool:
         """处理系统消息并更新订单状态
@@ -953,36 +1446,36 @@ class OrderStatusHandler:
             bool: 是否处理了订单状态更新
         """
         try:
-            # 定义消息类型与状态的映射
-            message_status_mapping = {
-                '[买家确认收货，交易成功]': 'completed',
-                '[你已确认收货，交易成功]': 'completed',  # 已完成
-                '[你已发货]': 'shipped',  # 已发货
-                '你已发货': 'shipped',  # 已发货（无方括号）
-                '[你已发货，请等待买家确认收货]': 'shipped',  # 已发货（完整格式）
-                '[我已付款，等待你发货]': 'pending_ship',  # 已付款，等待发货
-                '[我已拍下，待付款]': 'processing',  # 已拍下，待付款
-                '[买家已付款]': 'pending_ship',  # 买家已付款
-                '[付款完成]': 'pending_ship',  # 付款完成
-                '[已付款，待发货]': 'pending_ship',  # 已付款，待发货
-                '[退款成功，钱款已原路退返]': 'cancelled',  # 退款成功，设置为已关闭
-                '[你关闭了订单，钱款已原路退返]': 'cancelled',  # 卖家关闭订单，设置为已关闭
-            }
-            
+            # 约定：message在后续所有路径中按dict处理，非dict入参在此归一化，
+            # 下游的指纹计算、字段提取不再各自做类型分支
+            message = _as_message_dict(message)
+
+            # intern一次，后续映射命中时哈希探测直接走指针比较
+            if isinstance(send_message, str):
+                send_message = sys.intern(send_message)
+
             # 特殊处理：检查退款申请消息（需要同时识别标题和按钮文本）
             refund_status = self._check_refund_message(message, send_message)
             if refund_status:
                 new_status = refund_status
-            elif send_message in message_status_mapping:
-                new_status = message_status_mapping[send_message]
             else:
-                inferred_status = self._infer_status_from_message(send_message, message)
-                if inferred_status:
-                    logger.info(f"🔍 根据系统消息推断订单状态: {send_message} -> {inferred_status}")
-                    new_status = inferred_status
-                else:
-                    logger.debug(f"⚪ 未识别的系统消息，不更新订单状态: {send_message}")
-                    return False
+                # 常量映射走生成的身份比较链（入参已intern）
+                new_status = _dispatch_status(send_message)
+                if new_status is None:
+                    # 精确未命中时先查归一化倒排映射，再退到完整推断
+                    normalized_message = send_message.translate(_BRACKET_TRANS).strip() \
+                        if isinstance(send_message, str) else ''
+                    mapped_status = _NORM_STATUS_MAPPING.get(normalized_message)
+                    if mapped_status:
+                        new_status = mapped_status
+                    else:
+                        inferred_status = self._infer_status_from_message(send_message, message)
+                        if inferred_status:
+                            logger.info(f"🔍 根据系统消息推断订单状态: {send_message} -> {inferred_status}")
+                            new_status = inferred_status
+                        else:
+                            logger.debug("⚪ 未识别的系统消息，不更新订单状态: {}", send_message)
+                            return False
             # 提取订单ID，或根据聊天上下文回退匹配
             order_id = self.extract_order_id(message)
             if order_id:
@@ -998,7 +1491,7 @@ class OrderStatusHandler:
 
                     logger.info(f'[{msg_time}] 【{cookie_id}】{send_message}，暂时无法提取订单ID，添加到待处理队列')
 
-                    temp_order_id = f"temp_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+                    temp_order_id = _gen_temp_id()
 
                     self._add_to_pending_updates(
                         order_id=temp_order_id,
@@ -1007,19 +1500,21 @@ class OrderStatusHandler:
                         context=f"{send_message} - {msg_time} - 等待订单ID提取"
                     )
 
-                    if cookie_id not in self._pending_system_messages:
-                        self._pending_system_messages[cookie_id] = []
-
-                    self._pending_system_messages[cookie_id].append({
-                        'message': message,
-                        'send_message': send_message,
-                        'cookie_id': cookie_id,
-                        'msg_time': msg_time,
-                        'new_status': new_status,
-                        'temp_order_id': temp_order_id,
-                        'message_hash': hash(str(sorted(message.items()))) if isinstance(message, dict) else hash(str(message)),
-                        'timestamp': time.time()
-                    })
+                    enqueue_ts = time.time()
+                    with self._lock_for(cookie_id):
+                        queue = self._pending_system_messages.setdefault(cookie_id, _PendingMessageQueue())
+                        queue.append({
+                            'message': message,
+                            'send_message': send_message,
+                            'cookie_id': cookie_id,
+                            'msg_time': msg_time,
+                            'new_status': new_status,
+                            'temp_order_id': temp_order_id,
+                            'message_hash': _message_fingerprint(message),
+                            'timestamp': enqueue_ts
+                        })
+                    with self._lock:
+                        heapq.heappush(self._expiry_heap, (enqueue_ts, 1, cookie_id))
 
                     return True
             
@@ -1059,6 +1554,9 @@ class OrderStatusHandler:
             bool: 是否处理了订单状态更新
         """
         try:
+            # 约定同handle_system_message：message统一归一化为dict
+            message = _as_message_dict(message)
+
             # 根据红色提醒确定目标状态
             if red_reminder == '交易关闭':
                 target_status = 'cancelled'
@@ -1082,7 +1580,7 @@ class OrderStatusHandler:
 
                     logger.info(f'[{msg_time}] 【{cookie_id}】交易关闭，暂时无法提取订单ID，添加到待处理队列')
 
-                    temp_order_id = f"temp_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+                    temp_order_id = _gen_temp_id()
 
                     self._add_to_pending_updates(
                         order_id=temp_order_id,
@@ -1091,20 +1589,22 @@ class OrderStatusHandler:
                         context=f"{red_reminder} - 用户{user_id} - {msg_time} - 等待订单ID提取"
                     )
 
-                    if cookie_id not in self._pending_red_reminder_messages:
-                        self._pending_red_reminder_messages[cookie_id] = []
-
-                    self._pending_red_reminder_messages[cookie_id].append({
-                        'message': message,
-                        'red_reminder': red_reminder,
-                        'user_id': user_id,
-                        'cookie_id': cookie_id,
-                        'msg_time': msg_time,
-                        'new_status': target_status,
-                        'temp_order_id': temp_order_id,
-                        'message_hash': hash(str(sorted(message.items()))) if isinstance(message, dict) else hash(str(message)),
-                        'timestamp': time.time()
-                    })
+                    enqueue_ts = time.time()
+                    with self._lock_for(cookie_id):
+                        queue = self._pending_red_reminder_messages.setdefault(cookie_id, _PendingMessageQueue())
+                        queue.append({
+                            'message': message,
+                            'red_reminder': red_reminder,
+                            'user_id': user_id,
+                            'cookie_id': cookie_id,
+                            'msg_time': msg_time,
+                            'new_status': target_status,
+                            'temp_order_id': temp_order_id,
+                            'message_hash': _message_fingerprint(message),
+                            'timestamp': enqueue_ts
+                        })
+                    with self._lock:
+                        heapq.heappush(self._expiry_heap, (enqueue_ts, 2, cookie_id))
 
                     return True
             
@@ -1195,52 +1695,56 @@ class OrderStatusHandler:
             return
         
         logger.info(f"✅ 待处理队列已启用，检查订单 {order_id} 的待处理更新")
-        
+
+        self._drain_pending_intake()
         with self._lock:
-            if order_id in self.pending_updates:
-                logger.info(f"📝 检测到订单 {order_id} 详情已拉取，开始处理待处理的状态更新")
-                # 注意：process_pending_updates 内部也有锁，这里需要先释放锁避免死锁
-                updates = self.pending_updates.pop(order_id)
-                logger.info(f"📊 订单 {order_id} 有 {len(updates)} 个待处理更新")
-            else:
+            # pop带默认值：一次探测完成存在性判断与取出
+            updates = self.pending_updates.pop(order_id, None)
+            if updates is None:
                 logger.info(f"ℹ️ 订单 {order_id} 没有待处理的更新")
                 return
+
+            self._publish_pending_snapshot()
+            logger.info(f"📊 订单 {order_id} 有 {len(updates)} 个待处理更新")
         
         # 在锁外处理更新，避免死锁
-        if 'updates' in locals():
-            logger.info(f"🔄 开始处理订单 {order_id} 的 {len(updates)} 个待处理更新")
-            self._process_updates_outside_lock(order_id, updates)
-            logger.info(f"✅ 订单 {order_id} 的待处理更新处理完成")
-    
-    def _process_updates_outside_lock(self, order_id: str, updates: list):
-        """在锁外处理更新，避免死锁
-        
+        logger.info(f"🔄 开始处理订单 {order_id} 的 {len(updates)} 个待处理更新")
+        self._apply_pending_updates_batch(order_id, updates)
+        logger.info(f"✅ 订单 {order_id} 的待处理更新处理完成")
+
+    def _apply_pending_updates_batch(self, order_id: str, updates: list) -> int:
+        """把同一订单的待处理更新合并为一次批量状态更新
+
         Args:
             order_id: 订单ID
             updates: 更新列表
+
+        Returns:
+            int: 成功处理的更新数量
         """
         processed_count = 0
-        
-        for update_info in updates:
-            try:
-                success = self.update_order_status(
-                    order_id=order_id,
-                    new_status=update_info['new_status'],
-                    cookie_id=update_info['cookie_id'],
-                    context=f"待处理队列: {update_info['context']}"
-                )
-                
+        try:
+            batch = [
+                (order_id, update_info['new_status'], update_info['cookie_id'],
+                 f"待处理队列: {update_info['context']}")
+                for update_info in updates
+            ]
+            results = self.update_order_statuses(batch)
+            # 批量结果对同一订单是单一标志，循环外取一次
+            success = results.get(order_id)
+            for update_info in updates:
                 if success:
                     processed_count += 1
                     logger.info(f"处理待处理更新成功: 订单 {order_id} -> {update_info['new_status']}")
                 else:
                     logger.error(f"处理待处理更新失败: 订单 {order_id} -> {update_info['new_status']}")
-                    
-            except Exception as e:
-                logger.error(f"处理待处理更新时出错: {str(e)}")
-        
+        except Exception as e:
+            logger.error(f"处理待处理更新时出错: {str(e)}")
+
         if processed_count > 0:
             logger.info(f"订单 {order_id} 共处理了 {processed_count} 个待处理状态更新")
+
+        return processed_count
     
     def on_order_id_extracted(self, order_id: str, cookie_id: str, message: dict = None):
         """当主程序成功提取到订单ID后调用此方法处理待处理的系统消息
@@ -1253,9 +1757,12 @@ class OrderStatusHandler:
         logger.info(f"🔄 订单状态处理器.on_order_id_extracted开始: order_id={order_id}, cookie_id={cookie_id}")
 
         if message:
+            # 与入队侧走同一归一化，非dict消息的指纹才能对上
+            message = _as_message_dict(message)
             self._store_chat_order_mapping(order_id, cookie_id, message)
         
-        with self._lock:
+        # 账号分片锁：不同账号的延迟消息处理互不阻塞
+        with self._lock_for(cookie_id):
             # 检查是否启用待处理队列
             if not self.config.get('use_pending_queue', True):
                 logger.info(f"⏭️ 订单 {order_id} ID已提取，但未启用待处理队列，跳过处理")
@@ -1264,25 +1771,21 @@ class OrderStatusHandler:
             logger.info(f"✅ 待处理队列已启用，检查账号 {cookie_id} 的待处理系统消息")
             
             # 处理待处理的系统消息队列
-            if cookie_id in self._pending_system_messages and self._pending_system_messages[cookie_id]:
-                logger.info(f"📝 账号 {cookie_id} 有 {len(self._pending_system_messages[cookie_id])} 个待处理的系统消息")
+            queue = self._pending_system_messages.get(cookie_id)
+            if queue:
+                logger.info(f"📝 账号 {cookie_id} 有 {len(queue)} 个待处理的系统消息")
                 pending_msg = None
-                
-                # 如果提供了消息，尝试匹配
+
+                # 如果提供了消息，尝试匹配（哈希倒排索引，O(1)探测）
                 if message:
-                    logger.info(f"🔍 尝试通过消息哈希匹配待处理的系统消息")
-                    message_hash = hash(str(sorted(message.items()))) if isinstance(message, dict) else hash(str(message))
-                    # 从后往前遍历，避免pop时索引变化问题
-                    for i in range(len(self._pending_system_messages[cookie_id]) - 1, -1, -1):
-                        msg = self._pending_system_messages[cookie_id][i]
-                        if msg.get('message_hash') == message_hash:
-                            pending_msg = self._pending_system_messages[cookie_id].pop(i)
-                            logger.info(f"✅ 通过消息哈希匹配到待处理的系统消息: {pending_msg['send_message']}")
-                            break
-                
+                    message_hash = _message_fingerprint(message)
+                    pending_msg = queue.pop_by_hash(message_hash)
+                    if pending_msg:
+                        logger.info(f"✅ 通过消息哈希匹配到待处理的系统消息: {pending_msg['send_message']}")
+
                 # 如果没有匹配到，使用FIFO原则
-                if not pending_msg and self._pending_system_messages[cookie_id]:
-                    pending_msg = self._pending_system_messages[cookie_id].pop(0)
+                if not pending_msg and queue:
+                    pending_msg = queue.popleft()
                     logger.info(f"✅ 使用FIFO原则处理待处理的系统消息: {pending_msg['send_message']}")
                 
                 if pending_msg:
@@ -1304,12 +1807,16 @@ class OrderStatusHandler:
                     
                     # 清理临时订单ID的待处理更新
                     temp_order_id = pending_msg['temp_order_id']
-                    if temp_order_id in self.pending_updates:
-                        del self.pending_updates[temp_order_id]
-                        logger.info(f"🗑️ 清理临时订单ID {temp_order_id} 的待处理更新")
+                    self._drain_pending_intake()
+                    # pending_updates与快照是跨账号结构，修改与发布须在
+                    # 全局锁内（账号锁在外、全局锁在内，符合声明的加锁顺序）
+                    with self._lock:
+                        if self.pending_updates.pop(temp_order_id, None) is not None:
+                            self._publish_pending_snapshot()
+                            logger.info(f"🗑️ 清理临时订单ID {temp_order_id} 的待处理更新")
                     
                     # 如果队列为空，删除该账号的队列
-                    if not self._pending_system_messages[cookie_id]:
+                    if not queue:
                         del self._pending_system_messages[cookie_id]
                         logger.info(f"🗑️ 账号 {cookie_id} 的待处理系统消息队列已清空")
                 else:
@@ -1318,23 +1825,20 @@ class OrderStatusHandler:
                 logger.info(f"ℹ️ 账号 {cookie_id} 没有待处理的系统消息")
             
             # 处理待处理的红色提醒消息队列
-            if cookie_id in self._pending_red_reminder_messages and self._pending_red_reminder_messages[cookie_id]:
+            queue = self._pending_red_reminder_messages.get(cookie_id)
+            if queue:
                 pending_msg = None
-                
-                # 如果提供了消息，尝试匹配
+
+                # 如果提供了消息，尝试匹配（哈希倒排索引，O(1)探测）
                 if message:
-                    message_hash = hash(str(sorted(message.items()))) if isinstance(message, dict) else hash(str(message))
-                    # 从后往前遍历，避免pop时索引变化问题
-                    for i in range(len(self._pending_red_reminder_messages[cookie_id]) - 1, -1, -1):
-                        msg = self._pending_red_reminder_messages[cookie_id][i]
-                        if msg.get('message_hash') == message_hash:
-                            pending_msg = self._pending_red_reminder_messages[cookie_id].pop(i)
-                            logger.info(f"通过消息哈希匹配到待处理的红色提醒消息: {pending_msg['red_reminder']}")
-                            break
-                
+                    message_hash = _message_fingerprint(message)
+                    pending_msg = queue.pop_by_hash(message_hash)
+                    if pending_msg:
+                        logger.info(f"通过消息哈希匹配到待处理的红色提醒消息: {pending_msg['red_reminder']}")
+
                 # 如果没有匹配到，使用FIFO原则
-                if not pending_msg and self._pending_red_reminder_messages[cookie_id]:
-                    pending_msg = self._pending_red_reminder_messages[cookie_id].pop(0)
+                if not pending_msg and queue:
+                    pending_msg = queue.popleft()
                     logger.info(f"使用FIFO原则处理待处理的红色提醒消息: {pending_msg['red_reminder']}")
                 
                 if pending_msg:
@@ -1356,12 +1860,15 @@ class OrderStatusHandler:
                     
                     # 清理临时订单ID的待处理更新
                     temp_order_id = pending_msg['temp_order_id']
-                    if temp_order_id in self.pending_updates:
-                        del self.pending_updates[temp_order_id]
-                        logger.info(f"清理临时订单ID {temp_order_id} 的待处理更新")
+                    self._drain_pending_intake()
+                    # 同上：跨账号结构的修改与快照发布须在全局锁内
+                    with self._lock:
+                        if self.pending_updates.pop(temp_order_id, None) is not None:
+                            self._publish_pending_snapshot()
+                            logger.info(f"清理临时订单ID {temp_order_id} 的待处理更新")
                     
                     # 如果队列为空，删除该账号的队列
-                    if not self._pending_red_reminder_messages[cookie_id]:
+                    if not queue:
                         del self._pending_red_reminder_messages[cookie_id]
                 else:
                     logger.error(f"订单 {order_id} ID已提取，但没有找到对应的待处理红色提醒消息")
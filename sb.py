@@ -15,12 +15,21 @@ from __future__ import annotations
 
 import argparse
 import os
+import selectors
 import signal
+import stat
 import subprocess
 import sys
 import time
 from pathlib import Path
 
+# inotify 事件驱动日志跟随（可选依赖，仅 Linux；缺失时自动退回轮询）
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+    inotify_flags = None
+
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 VENV_PYTHON = PROJECT_ROOT / "venv" / "bin" / "python"
@@ -33,13 +42,56 @@ COOKIE_CLOUD_HOST = os.getenv("COOKIE_CLOUD_HOST", "").strip()
 COOKIE_CLOUD_UUID = os.getenv("COOKIE_CLOUD_UUID", "").strip()
 COOKIE_CLOUD_PASSWORD = os.getenv("COOKIE_CLOUD_PASSWORD", "").strip()
 
+# 浏览器进程名常量（模块级一次构建）：精确名集合 + 连字符衍生名前缀
+BROWSER_EXACT = frozenset({
+    'chromium',
+    'chromium-browser',
+    'chrome',
+    'google-chrome',
+    'google-chrome-stable',
+})
+BROWSER_PREFIXES = tuple(f"{name}-" for name in BROWSER_EXACT)
+
+# 同一批名字在 /proc/<pid>/comm 里的形态（内核截断到15字符，带换行）
+BROWSER_COMM_NAMES = frozenset({
+    b'chromium\n',
+    b'chromium-browse\n',   # chromium-browser 截断后
+    b'chrome\n',
+    b'google-chrome\n',
+    b'google-chrome-s\n',   # google-chrome-stable 截断后
+})
+
+
+# PID 读取缓存：(st_mtime_ns, pid)，文件未变化时省掉 open+read+int
+_pid_cache: tuple[int, int | None] | None = None
+
 
 def read_pid() -> int | None:
-    if PID_FILE.exists():
-        try:
-            return int(PID_FILE.read_text().strip())
-        except ValueError:
-            return None
+    global _pid_cache
+    try:
+        mtime_ns = os.stat(PID_FILE).st_mtime_ns
+    except FileNotFoundError:
+        _pid_cache = (0, None)
+        return None
+
+    if _pid_cache is not None and _pid_cache[0] == mtime_ns:
+        return _pid_cache[1]
+
+    # 原子 rename 杜绝了半截内容，但升级前遗留 / 手工编辑的
+    # PID 文件仍可能不是整数，保留 ValueError 兜底（结果照常缓存）
+    try:
+        pid = int(PID_FILE.read_bytes().strip())
+    except (FileNotFoundError, ValueError):
+        pid = None
+    _pid_cache = (mtime_ns, pid)
+    return pid
+
+
+def read_running_pid() -> int | None:
+    """读取 PID 并确认进程仍存活，不存活返回 None"""
+    pid = read_pid()
+    if pid is not None and is_running(pid):
+        return pid
     return None
 
 
@@ -55,15 +107,32 @@ def is_running(pid: int) -> bool:
 
 
 def start() -> None:
-    pid = read_pid()
-    if pid and is_running(pid):
+    pid = read_running_pid()
+    if pid:
         print(f"Start.py 已在运行 (PID={pid})")
         return
 
     if not VENV_PYTHON.exists():
         sys.exit(f"未找到虚拟环境 Python: {VENV_PYTHON}")
 
-    env = os.environ.copy()
+    # 默认整份拷贝宿主环境，已有部署导出的 DB_PATH/API_* 等配置原样
+    # 到达子进程；SB_MINIMAL_ENV=1 切换为白名单最小环境（减小 execve
+    # 传参量、避免无关凭据泄漏），SB_PASSTHROUGH_ENV=A,B,C 在最小
+    # 模式下追加透传
+    if os.getenv("SB_MINIMAL_ENV", "").strip() == "1":
+        passthrough = [
+            "PATH", "HOME", "USER", "LANG", "LC_ALL", "TZ", "VIRTUAL_ENV",
+            # 应用自身会读取的配置项（Start.py / config.py / db_manager.py）
+            "DB_PATH", "API_HOST", "API_PORT", "COOKIES_STR", "DOCKER_ENV",
+            "COOKIE_CLOUD_REFRESH_SECONDS", "COOKIE_CLOUD_REFRESH_INTERVAL",
+            "COOKIE_CLOUD_COOKIE_ID", "COOKIE_REFRESH_ON_TOKEN_FAILURE_ONLY",
+            "SQL_LOG_ENABLED", "SQL_LOG_LEVEL",
+        ]
+        extra = os.getenv("SB_PASSTHROUGH_ENV", "")
+        passthrough.extend(k.strip() for k in extra.split(",") if k.strip())
+        env = {k: os.environ[k] for k in passthrough if k in os.environ}
+    else:
+        env = os.environ.copy()
 
     cookiecloud_env = {
         "COOKIE_CLOUD_HOST": COOKIE_CLOUD_HOST,
@@ -74,9 +143,12 @@ def start() -> None:
     # 仅在值非空时覆盖，便于通过 shell 手动导出环境变量
     env.update({k: v for k, v in cookiecloud_env.items() if v})
 
-    # 确保日志文件存在
+    # 子进程不缓冲 stdout，日志按行落盘，避免 8KB 块缓冲带来的分钟级延迟
+    env["PYTHONUNBUFFERED"] = "1"
+
+    # 确保日志文件存在（buffering=1 行缓冲）
     LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-    log_fp = LOG_FILE.open("a", encoding="utf-8")
+    log_fp = LOG_FILE.open("a", encoding="utf-8", buffering=1)
 
     cmd = [str(VENV_PYTHON), str(START_SCRIPT)]
     process = subprocess.Popen(
@@ -87,7 +159,11 @@ def start() -> None:
         stderr=subprocess.STDOUT,
         preexec_fn=os.setsid,  # 让进程独立于当前终端
     )
-    PID_FILE.write_text(str(process.pid))
+    # 原子写 PID：先落临时文件再 rename，并发的 stop()/status()
+    # 不可能读到写了一半的内容
+    tmp_pid = PID_FILE.with_suffix(".pid.tmp")
+    tmp_pid.write_text(str(process.pid))
+    os.replace(tmp_pid, PID_FILE)
     print(f"Start.py 已启动，PID={process.pid}，日志写入 {LOG_FILE}")
 
 
@@ -96,29 +172,23 @@ def cleanup_browser_processes() -> None:
     try:
         import psutil
     except ImportError:
-        # 如果没有psutil，使用更安全的方法
+        # 如果没有psutil，直接扫描 /proc，不经过 shell/ps/awk 管道
         print("🧹 清理残留浏览器进程...")
 
-        # 使用ps和grep查找特定的浏览器进程
+        killed_count = 0
         try:
-            # 查找chromium进程
-            result = subprocess.run(
-                "ps aux | grep -E '(chromium|google-chrome)' | grep -v grep | awk '{print $2}'",
-                shell=True,
-                capture_output=True,
-                text=True
-            )
-
-            pids = result.stdout.strip().split('\n')
-            killed_count = 0
-
-            for pid in pids:
-                if pid and pid.isdigit():
-                    try:
-                        subprocess.run(['kill', '-9', pid], capture_output=True)
+            for entry in os.listdir('/proc'):
+                if not entry.isdigit():
+                    continue
+                try:
+                    with open(f'/proc/{entry}/comm', 'rb') as f:
+                        comm = f.read()
+                    if comm in BROWSER_COMM_NAMES:
+                        os.kill(int(entry), signal.SIGKILL)
                         killed_count += 1
-                    except:
-                        pass
+                except (FileNotFoundError, ProcessLookupError, PermissionError):
+                    # 进程已退出或无权限，跳过
+                    pass
 
             if killed_count > 0:
                 print(f"✅ 已清理 {killed_count} 个浏览器进程")
@@ -133,42 +203,37 @@ def cleanup_browser_processes() -> None:
     # 如果有psutil，使用更精确的方法
     print("🧹 清理残留浏览器进程...")
 
-    # 只匹配真正的浏览器进程名，不匹配命令行参数
-    browser_process_names = [
-        'chromium',
-        'chromium-browser',
-        'chrome',
-        'google-chrome',
-        'google-chrome-stable',
-    ]
-
-    killed_processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'exe']):
+    # 先只取进程名过滤（只匹配真正的浏览器进程名，不匹配命令行参数），
+    # 命中后才读 exe 路径确认，避免全表 /proc 解析
+    matched = []
+    for proc in psutil.process_iter(['pid', 'name']):
         try:
             proc_name = proc.info['name']
             if not proc_name:
                 continue
+            if proc_name not in BROWSER_EXACT and not proc_name.startswith(BROWSER_PREFIXES):
+                continue
 
-            # 严格匹配进程名
-            for browser_name in browser_process_names:
-                if proc_name == browser_name or proc_name.startswith(f"{browser_name}-"):
-                    try:
-                        # 获取进程的可执行文件路径
-                        exe_path = proc.info.get('exe', '')
-                        # 确认是浏览器进程（路径包含chrome或chromium）
-                        if 'chrome' in exe_path.lower() or 'chromium' in exe_path.lower():
-                            proc.terminate()
-                            killed_processes.append(f"{proc_name} (PID: {proc.info['pid']})")
-                            time.sleep(0.1)
-                            if proc.is_running():
-                                proc.kill()
-                            break
-                    except:
-                        pass
-
+            # 确认是浏览器进程（路径包含chrome或chromium）
+            exe_path = proc.exe() or ''
+            if 'chrome' in exe_path.lower() or 'chromium' in exe_path.lower():
+                proc.terminate()
+                matched.append(proc)
         except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
             pass
 
+    # 批量 SIGTERM 之后只等待一次，再强杀仍存活的进程
+    killed_processes = []
+    if matched:
+        time.sleep(0.1)
+        for proc in matched:
+            try:
+                if proc.is_running():
+                    proc.kill()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+            killed_processes.append(f"{proc.info['name']} (PID: {proc.info['pid']})")
+
     if killed_processes:
         print(f"✅ 已清理以下进程:")
         for p in killed_processes:
@@ -177,6 +242,18 @@ def cleanup_browser_processes() -> None:
         print("没有发现浏览器进程")
 
 
+def _wait_for_exit(pid: int, timeout: float) -> bool:
+    """等待进程退出：10ms 起步指数退避轮询，退出立即返回 True，超时返回 False"""
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while time.monotonic() < deadline:
+        if not is_running(pid):
+            return True
+        time.sleep(delay)
+        delay = min(delay * 1.5, 0.5)
+    return not is_running(pid)
+
+
 def stop() -> None:
     pid = read_pid()
 
@@ -195,13 +272,13 @@ def stop() -> None:
     os.killpg(pid, signal.SIGTERM)
     print(f"已发送终止信号到 PID {pid}，等待退出...")
 
-    # 简单等待几秒钟
-    for _ in range(10):
-        if not is_running(pid):
-            break
-        time.sleep(0.5)
+    # 给优雅退出留足时间，可用 SB_STOP_TIMEOUT 调整（秒）
+    try:
+        stop_timeout = float(os.getenv("SB_STOP_TIMEOUT", "30"))
+    except ValueError:
+        stop_timeout = 30.0
 
-    if is_running(pid):
+    if not _wait_for_exit(pid, stop_timeout):
         print("进程尚未退出，尝试强制终止。")
         os.killpg(pid, signal.SIGKILL)
 
@@ -215,13 +292,114 @@ def stop() -> None:
 
 
 def status() -> None:
-    pid = read_pid()
-    if pid and is_running(pid):
+    pid = read_running_pid()
+    if pid:
         print(f"Start.py 正在运行 (PID={pid})。日志文件: {LOG_FILE}")
     else:
         print("Start.py 未运行。")
 
 
+def _tail_log_polling() -> None:
+    """轮询回退：无 inotify 时每 0.5 秒检查一次新内容（非 Linux 平台）"""
+    with LOG_FILE.open("r", encoding="utf-8", errors="ignore") as fp:
+        fp.seek(0, os.SEEK_END)
+        while True:
+            line = fp.readline()
+            if not line:
+                time.sleep(0.5)
+            else:
+                print(line, end="", flush=True)
+
+
+def _tail_log_selector() -> None:
+    """无 inotify 平台的就绪等待回退（macOS 走 kqueue）：数据就绪后
+    os.read 批量读并按字节写 stdout，不再每 0.5s 空转一次 readline 解码；
+    不完整的行先攒在 bytearray 里，凑满整行才输出"""
+    out = sys.stdout.buffer
+    buf = bytearray()
+    with LOG_FILE.open("rb") as fp:
+        fp.seek(0, os.SEEK_END)
+        fd = fp.fileno()
+        with selectors.DefaultSelector() as sel:
+            # Linux 的 epoll 不支持普通文件，register 会抛 OSError，
+            # 由调用方退回轮询实现
+            sel.register(fd, selectors.EVENT_READ)
+            while True:
+                sel.select(timeout=None)
+                while chunk := os.read(fd, 65536):
+                    buf += chunk
+                    nl = buf.rfind(b"\n")
+                    if nl >= 0:
+                        out.write(buf[:nl + 1])
+                        out.flush()
+                        del buf[:nl + 1]
+
+
+def _tail_log_inotify() -> None:
+    """inotify 事件驱动跟随：空闲时阻塞在内核事件上，不做定时唤醒"""
+    watch_flags = inotify_flags.MODIFY | inotify_flags.MOVE_SELF | inotify_flags.DELETE_SELF
+    seek_to_end = True
+    while True:
+        with LOG_FILE.open("r", encoding="utf-8", errors="ignore") as fp:
+            if seek_to_end:
+                fp.seek(0, os.SEEK_END)
+                seek_to_end = False
+            with INotify() as inotify:
+                inotify.add_watch(str(LOG_FILE), watch_flags)
+                # 重开后文件可能已有内容，先读一遍再等事件
+                while line := fp.readline():
+                    print(line, end="", flush=True)
+                rotated = False
+                while not rotated:
+                    for event in inotify.read():
+                        if event.mask & (inotify_flags.MOVE_SELF | inotify_flags.DELETE_SELF):
+                            rotated = True
+                    # 先读尽剩余内容，再决定是否重开（logrotate 场景）
+                    while line := fp.readline():
+                        print(line, end="", flush=True)
+        # 日志被轮转/删除：等待新文件出现后从头继续跟随
+        while not LOG_FILE.exists():
+            time.sleep(0.1)
+
+
+def _tail_log_sendfile() -> None:
+    """stdout 为管道/普通文件时的零拷贝跟随：sendfile 让内核直接搬字节，
+    不经过 Python 层的解码/编码，事件等待仍由 inotify 驱动"""
+    out_fd = sys.stdout.fileno()
+    watch_flags = inotify_flags.MODIFY | inotify_flags.MOVE_SELF | inotify_flags.DELETE_SELF
+    seek_to_end = True
+    while True:
+        fd = os.open(str(LOG_FILE), os.O_RDONLY)
+        try:
+            if seek_to_end:
+                os.lseek(fd, 0, os.SEEK_END)
+                seek_to_end = False
+            with INotify() as inotify:
+                inotify.add_watch(str(LOG_FILE), watch_flags)
+                while os.sendfile(out_fd, fd, None, 1 << 20) > 0:
+                    pass
+                rotated = False
+                while not rotated:
+                    for event in inotify.read():
+                        if event.mask & (inotify_flags.MOVE_SELF | inotify_flags.DELETE_SELF):
+                            rotated = True
+                    while os.sendfile(out_fd, fd, None, 1 << 20) > 0:
+                        pass
+        finally:
+            os.close(fd)
+        while not LOG_FILE.exists():
+            time.sleep(0.1)
+
+
+def _stdout_supports_sendfile() -> bool:
+    """stdout 是管道或普通文件（重定向场景）时可用 sendfile；tty 保持逐行打印"""
+    try:
+        mode = os.fstat(sys.stdout.fileno()).st_mode
+    except (OSError, ValueError):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISREG(mode)
+
+
 def tail_log() -> None:
     if not LOG_FILE.exists():
         print("日志文件不存在。")
@@ -229,14 +407,16 @@ def tail_log() -> None:
 
     print(f"实时查看 {LOG_FILE}，按 Ctrl+C 退出。")
     try:
-        with LOG_FILE.open("r", encoding="utf-8", errors="ignore") as fp:
-            fp.seek(0, os.SEEK_END)
-            while True:
-                line = fp.readline()
-                if not line:
-                    time.sleep(0.5)
-                else:
-                    print(line, end="")
+        if INotify is not None and _stdout_supports_sendfile():
+            sys.stdout.flush()
+            _tail_log_sendfile()
+        elif INotify is not None:
+            _tail_log_inotify()
+        else:
+            try:
+                _tail_log_selector()
+            except OSError:
+                _tail_log_polling()
     except KeyboardInterrupt:
         print("\n已退出日志查看。")
 
@@ -14,8 +14,10 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import functools
 import hashlib
 import json
+import os
 from typing import Dict, List, Optional, Any, Tuple
 
 from loguru import logger
@@ -25,10 +27,44 @@ import aiohttp
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes  # type: ignore
 from cryptography.hazmat.backends import default_backend  # type: ignore
 
+# orjson 为可选加速（SIMD 解析、直接吃 bytes），缺失时回退标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-__all__ = ["fetch_cookiecloud_cookie_str", "build_cookie_str_from_cookie_data"]
 
+def _loads(raw) -> Any:
+    """bytes/str 直接解析 JSON，bytes 输入省掉一次整段 UTF-8 解码"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
+
+__all__ = ["fetch_cookiecloud_cookie_str", "build_cookie_str_from_cookie_data", "aclose_session"]
+
+# 跨轮询复用的共享会话：连接池、TLS 握手、DNS 缓存都摊销到多次同步
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    """懒创建模块级共享 ClientSession；超时由每次请求单独指定"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=4, ttl_dns_cache=300, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def aclose_session() -> None:
+    """关闭共享会话（进程退出或重载时调用）"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+@functools.lru_cache(maxsize=8)
 def _normalize_host(host: str) -> str:
     if not host:
         return ""
@@ -46,7 +82,7 @@ def _extract_cookie_data(payload: Any) -> Optional[Dict[str, List[dict]]]:
     - 其他：返回 None
     """
     try:
-        obj = json.loads(payload) if isinstance(payload, str) else payload
+        obj = _loads(payload) if isinstance(payload, (str, bytes)) else payload
     except Exception:
         return None
 
@@ -79,24 +115,29 @@ def build_cookie_str_from_cookie_data(cookie_data: Dict[str, List[dict]], prefer
         ".taobao.com",
     ]
 
-    def domain_priority(domain: str) -> Tuple[int, int]:
-        # 高优先级：命中 prefer_domains（越靠前优先级越高）
-        for idx, d in enumerate(prefer_domains):
-            if d in domain:
-                return (0, idx)
-        return (1, 999)
-
-    cookies_ordered: List[Tuple[str, List[dict]]] = []
+    # 按偏好序分桶代替整体排序：精确命中只查一次哈希，未命中才做子串扫描；
+    # 写入用 setdefault，先写入（优先级更高）的值生效
+    exact_idx = {d: idx for idx, d in enumerate(prefer_domains)}
+    preferred: List[List[List[dict]]] = [[] for _ in prefer_domains]
+    others: List[List[dict]] = []
     for domain, items in (cookie_data or {}).items():
         if not isinstance(items, list):
             continue
-        cookies_ordered.append((domain or "", items))
-
-    # 根据偏好域名排序
-    cookies_ordered.sort(key=lambda t: domain_priority(t[0]))
+        domain = domain or ""
+        idx = exact_idx.get(domain)
+        if idx is None:
+            for i, d in enumerate(prefer_domains):
+                if d in domain:
+                    idx = i
+                    break
+        if idx is None:
+            others.append(items)
+        else:
+            preferred[idx].append(items)
 
     kv: Dict[str, str] = {}
-    for domain, items in cookies_ordered:
+
+    def _collect(items: List[dict]) -> None:
         for it in items:
             if not isinstance(it, dict):
                 continue
@@ -108,10 +149,16 @@ def build_cookie_str_from_cookie_data(cookie_data: Dict[str, List[dict]], prefer
             value_str = str(value)
             if value_str == "":
                 continue
-            kv[name] = value_str
+            kv.setdefault(name, value_str)
+
+    for bucket in preferred:
+        for items in bucket:
+            _collect(items)
+    for items in others:
+        _collect(items)
 
     # 输出 name=value; name2=value2
-    return "; ".join([f"{k}={v}" for k, v in kv.items()])
+    return "; ".join(f"{k}={v}" for k, v in kv.items())
 
 
 def _pkcs7_unpad(data: bytes, block_size: int = 16) -> bytes:
@@ -133,6 +180,15 @@ def _evp_bytes_to_key(password: bytes, salt: bytes, key_len: int = 32, iv_len: i
     if salt and len(salt) != 8:
         raise ValueError(f"salt length is {len(salt)}, expected 8")
 
+    # AES-256-CBC 固定需要 48 字节（MD5 恰好 3 轮），直接展开省掉循环与判断
+    if key_len == 32 and iv_len == 16:
+        seed = password + (salt or b"")
+        d0 = hashlib.md5(seed).digest()
+        d1 = hashlib.md5(d0 + seed).digest()
+        d2 = hashlib.md5(d1 + seed).digest()
+        material = d0 + d1 + d2
+        return material[:32], material[32:48]
+
     d = b""
     last = b""
     while len(d) < (key_len + iv_len):
@@ -143,6 +199,34 @@ def _evp_bytes_to_key(password: bytes, salt: bytes, key_len: int = 32, iv_len: i
     return d[:key_len], d[key_len:key_len + iv_len]
 
 
+# 密钥派生缓存开关：安全敏感部署可设 COOKIECLOUD_NO_DERIVE_CACHE=1 关闭
+_DERIVE_CACHE_DISABLED = os.getenv("COOKIECLOUD_NO_DERIVE_CACHE", "").strip().lower() in ("1", "true", "yes")
+
+
+@functools.lru_cache(maxsize=8)
+def _derive_passphrase_cached(uuid: str, password: str) -> str:
+    return hashlib.md5(f"{uuid}-{password}".encode("utf-8")).hexdigest()[:16]
+
+
+def _derive_passphrase(uuid: str, password: str) -> str:
+    """passphrase = md5(f"{uuid}-{password}")[:16]；定时轮询时入参固定，命中缓存"""
+    if _DERIVE_CACHE_DISABLED:
+        return hashlib.md5(f"{uuid}-{password}".encode("utf-8")).hexdigest()[:16]
+    return _derive_passphrase_cached(uuid, password)
+
+
+@functools.lru_cache(maxsize=8)
+def _derive_key_iv_cached(passphrase: bytes, salt: bytes) -> Tuple[bytes, bytes]:
+    return _evp_bytes_to_key(passphrase, salt, key_len=32, iv_len=16)
+
+
+def _derive_key_iv(passphrase: bytes, salt: bytes) -> Tuple[bytes, bytes]:
+    """salt 不变（取决于服务端是否复用密文）时跳过 MD5 链"""
+    if _DERIVE_CACHE_DISABLED:
+        return _evp_bytes_to_key(passphrase, salt, key_len=32, iv_len=16)
+    return _derive_key_iv_cached(passphrase, salt)
+
+
 def _decrypt_cryptojs_encrypted(encrypted_b64: str, passphrase: str) -> bytes:
     """
     解密 CryptoJS.AES.encrypt(msg, passphrase) 生成的密文（OpenSSL 兼容，带 "Salted__" 头）。
@@ -154,48 +238,66 @@ def _decrypt_cryptojs_encrypted(encrypted_b64: str, passphrase: str) -> bytes:
     salt = raw[8:16]
     ciphertext = raw[16:]
 
-    key, iv = _evp_bytes_to_key(passphrase.encode("utf-8"), salt, key_len=32, iv_len=16)
+    key, iv = _derive_key_iv(passphrase.encode("utf-8"), salt)
     cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
     decryptor = cipher.decryptor()
     padded = decryptor.update(ciphertext) + decryptor.finalize()
     return _pkcs7_unpad(padded, block_size=16)
 
 
-async def _post_try_plain(session: aiohttp.ClientSession, url: str, password: str) -> Optional[dict]:
-    """
-    用 POST 方式提交 password 尝试让服务端直接返回明文。
-    先以 x-www-form-urlencoded 提交，不行再 JSON。
-    返回解析后的 JSON 对象或 None。
-    """
-    # 1) application/x-www-form-urlencoded
+async def _post_one(session: aiohttp.ClientSession, url: str, password: str,
+                    as_json: bool, timeout_obj: Optional[aiohttp.ClientTimeout] = None,
+                    delay: float = 0.0) -> Optional[dict]:
+    """单次 POST 尝试（form 或 JSON）；delay 为对冲请求的起跑延迟"""
+    if delay:
+        await asyncio.sleep(delay)
+    kind = "json" if as_json else "form"
     try:
-        async with session.post(url, data={"password": password}) as resp:
-            text = await resp.text()
+        kwargs = {"json": {"password": password}} if as_json else {"data": {"password": password}}
+        async with session.post(url, timeout=timeout_obj, **kwargs) as resp:
+            raw = await resp.read()
             if resp.status == 200:
                 try:
-                    return json.loads(text)
+                    return _loads(raw)
                 except Exception:
-                    logger.debug("CookieCloud POST form 返回非 JSON，尝试 JSON 提交")
+                    logger.debug("CookieCloud POST {} 返回非 JSON", kind)
             else:
-                logger.debug(f"CookieCloud POST form 失败: HTTP {resp.status}, {text[:200]}")
+                # 出错才解码，且只解前 200 字节
+                logger.debug("CookieCloud POST {} 失败: HTTP {}, {}", kind, resp.status,
+                             raw[:200].decode("utf-8", "replace"))
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logger.debug(f"CookieCloud POST form 异常: {e}")
+        logger.debug("CookieCloud POST {} 异常: {}", kind, e)
+    return None
 
-    # 2) application/json
-    try:
-        async with session.post(url, json={"password": password}) as resp:
-            text = await resp.text()
-            if resp.status == 200:
-                try:
-                    return json.loads(text)
-                except Exception:
-                    logger.debug("CookieCloud POST json 返回非 JSON")
-            else:
-                logger.debug(f"CookieCloud POST json 失败: HTTP {resp.status}, {text[:200]}")
-    except Exception as e:
-        logger.debug(f"CookieCloud POST json 异常: {e}")
 
-    return None
+async def _post_try_plain(session: aiohttp.ClientSession, url: str, password: str,
+                          timeout_obj: Optional[aiohttp.ClientTimeout] = None) -> Optional[dict]:
+    """
+    用 POST 方式提交 password 尝试让服务端直接返回明文。
+    form 与 JSON 两种提交并发对冲（JSON 延迟 50ms 起跑，避免对
+    两种都接受的服务端白打一枪），先返回可用 JSON 者胜出，
+    另一个立即取消。返回解析后的 JSON 对象或 None。
+    """
+    pending = {
+        asyncio.create_task(_post_one(session, url, password, as_json=False, timeout_obj=timeout_obj)),
+        asyncio.create_task(_post_one(session, url, password, as_json=True, timeout_obj=timeout_obj, delay=0.05)),
+    }
+    result = None
+    while pending and result is None:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            data = task.result()
+            if data is not None and result is None:
+                result = data
+
+    if pending:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return result
 
 
 async def fetch_cookiecloud_cookie_str(host: str, uuid: str, password: str, timeout: int = 15) -> Optional[str]:
@@ -215,78 +317,79 @@ async def fetch_cookiecloud_cookie_str(host: str, uuid: str, password: str, time
 
     try:
         timeout_obj = aiohttp.ClientTimeout(total=timeout)
-        async with aiohttp.ClientSession(timeout=timeout_obj) as session:
-            # 1) 优先 POST 明文（服务端要求：GET 不能用于解密）
-            if password:
-                post_data = await _post_try_plain(session, url, password)
-                if post_data is not None:
-                    cookie_data = _extract_cookie_data(post_data)
-                    if cookie_data:
-                        cookies_str = build_cookie_str_from_cookie_data(cookie_data)
-                        logger.info(f"CookieCloud 拉取成功（POST 明文），合并后 Cookie 长度: {len(cookies_str)}")
-                        return cookies_str
-                    # 如果 POST 返回了 encrypted，则继续走加密解密分支
-                    if isinstance(post_data, dict) and isinstance(post_data.get("encrypted"), str):
-                        logger.debug("CookieCloud POST 返回 encrypted，准备本地解密")
-                        data = post_data
-                    else:
-                        data = None
+        session = await _get_session()
+        # 1) 优先 POST 明文（服务端要求：GET 不能用于解密）
+        if password:
+            post_data = await _post_try_plain(session, url, password, timeout_obj=timeout_obj)
+            if post_data is not None:
+                cookie_data = _extract_cookie_data(post_data)
+                if cookie_data:
+                    cookies_str = build_cookie_str_from_cookie_data(cookie_data)
+                    logger.info(f"CookieCloud 拉取成功（POST 明文），合并后 Cookie 长度: {len(cookies_str)}")
+                    return cookies_str
+                # 如果 POST 返回了 encrypted，则继续走加密解密分支
+                if isinstance(post_data, dict) and isinstance(post_data.get("encrypted"), str):
+                    logger.debug("CookieCloud POST 返回 encrypted，准备本地解密")
+                    data = post_data
                 else:
                     data = None
             else:
                 data = None
-
-            # 2) 若 POST 不可用或未返回明文，则 GET 获取加密数据
-            if data is None:
-                async with session.get(get_url) as resp:
-                    text = await resp.text()
-                    if resp.status != 200:
-                        logger.error(f"CookieCloud GET 请求失败: HTTP {resp.status}, 响应: {text[:200]}")
-                        return None
-                    try:
-                        data = json.loads(text)
-                    except Exception:
-                        logger.error("CookieCloud GET 响应不是 JSON")
-                        return None
-
-            # 3) 处理加密分支（本地解密）
-            if isinstance(data, dict) and isinstance(data.get("encrypted"), str):
-                if not password:
-                    logger.warning("CookieCloud 返回 encrypted，但未提供密码，无法解密。")
+        else:
+            data = None
+
+        # 2) 若 POST 不可用或未返回明文，则 GET 获取加密数据
+        if data is None:
+            async with session.get(get_url, timeout=timeout_obj) as resp:
+                raw = await resp.read()
+                if resp.status != 200:
+                    logger.error(f"CookieCloud GET 请求失败: HTTP {resp.status}, "
+                                 f"响应: {raw[:200].decode('utf-8', 'replace')}")
                     return None
-
-                # 计算 passphrase：md5(f"{uuid}-{password}")[:16]
-                passphrase = hashlib.md5(f"{uuid}-{password}".encode("utf-8")).hexdigest()[:16]
                 try:
-                    decrypted = _decrypt_cryptojs_encrypted(data["encrypted"], passphrase)
-                    decrypted_text = decrypted.decode("utf-8", errors="ignore")
-                    try:
-                        decrypted_obj = json.loads(decrypted_text)
-                    except Exception as e:
-                        logger.error(f"CookieCloud 解密后 JSON 解析失败: {e}")
-                        return None
-
-                    cookie_data = _extract_cookie_data(decrypted_obj)
-                    if not cookie_data:
-                        logger.error(f"CookieCloud 解密后未找到 cookie_data 字段: {str(decrypted_obj)[:200]}")
-                        return None
+                    data = _loads(raw)
+                except Exception:
+                    logger.error("CookieCloud GET 响应不是 JSON")
+                    return None
 
-                    cookies_str = build_cookie_str_from_cookie_data(cookie_data)
-                    logger.info(f"CookieCloud 解密成功，合并后 Cookie 长度: {len(cookies_str)}")
-                    return cookies_str
+        # 3) 处理加密分支（本地解密）
+        if isinstance(data, dict) and isinstance(data.get("encrypted"), str):
+            if not password:
+                logger.warning("CookieCloud 返回 encrypted，但未提供密码，无法解密。")
+                return None
+
+            # 计算 passphrase：md5(f"{uuid}-{password}")[:16]（带缓存）
+            passphrase = _derive_passphrase(uuid, password)
+            try:
+                decrypted = _decrypt_cryptojs_encrypted(data["encrypted"], passphrase)
+                decrypted_text = decrypted.decode("utf-8", errors="ignore")
+                try:
+                    decrypted_obj = json.loads(decrypted_text)
                 except Exception as e:
-                    logger.error(f"CookieCloud 本地解密失败: {e}")
+                    logger.error(f"CookieCloud 解密后 JSON 解析失败: {e}")
+                    return None
+
+                cookie_data = _extract_cookie_data(decrypted_obj)
+                if not cookie_data:
+                    logger.error(f"CookieCloud 解密后未找到 cookie_data 字段: {str(decrypted_obj)[:200]}")
                     return None
 
-            # 4) 明文但格式异常
-            cookie_data = _extract_cookie_data(data)
-            if cookie_data:
                 cookies_str = build_cookie_str_from_cookie_data(cookie_data)
-                logger.info(f"CookieCloud 拉取成功（明文），合并后 Cookie 长度: {len(cookies_str)}")
+                logger.info(f"CookieCloud 解密成功，合并后 Cookie 长度: {len(cookies_str)}")
                 return cookies_str
-
-            logger.error(f"CookieCloud 返回格式无法识别: {str(data)[:200]}")
-            return None
+            except Exception as e:
+                logger.error(f"CookieCloud 本地解密失败: {e}")
+                return None
+
+        # 4) 明文但格式异常
+        cookie_data = _extract_cookie_data(data)
+        if cookie_data:
+            cookies_str = build_cookie_str_from_cookie_data(cookie_data)
+            logger.info(f"CookieCloud 拉取成功（明文），合并后 Cookie 长度: {len(cookies_str)}")
+            return cookies_str
+
+        logger.error(f"CookieCloud 返回格式无法识别: {str(data)[:200]}")
+        return None
 
     except asyncio.TimeoutError:
         logger.error("CookieCloud 请求超时")
@@ -299,11 +402,11 @@ async def fetch_cookiecloud_cookie_str(host: str, uuid: str, password: str, time
 # 可选：同步封装，便于在同步环境测试
 def fetch_cookiecloud_cookie_str_sync(host: str, uuid: str, password: str, timeout: int = 15) -> Optional[str]:
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # 嵌入到已运行的事件循环中由调用方处理
-            logger.error("当前存在运行中的事件循环，无法直接同步调用 fetch_cookiecloud_cookie_str")
-            return None
-        return loop.run_until_complete(fetch_cookiecloud_cookie_str(host, uuid, password, timeout=timeout))
+        asyncio.get_running_loop()
     except RuntimeError:
-        return asyncio.run(fetch_cookiecloud_cookie_str(host, uuid, password, timeout=timeout))
\ No newline at end of file
+        # 没有运行中的事件循环：asyncio.run 自建并清理，
+        # 避开 get_event_loop 的弃用路径和白建一个循环的开销
+        return asyncio.run(fetch_cookiecloud_cookie_str(host, uuid, password, timeout=timeout))
+    # 嵌入到已运行的事件循环中由调用方处理
+    logger.error("当前存在运行中的事件循环，无法直接同步调用 fetch_cookiecloud_cookie_str")
+    return None
\ No newline at end of file
@@ -60,6 +60,7 @@ class QRLoginSession:
         self.expire_time = 300  # 5分钟过期
         self.params = {}  # 存储登录参数
         self.verification_url = None  # 风控验证URL
+        self.event = asyncio.Event()  # 状态进入终态（成功/过期/取消/风控）时触发，供调用方事件驱动等待
 
     def is_expired(self) -> bool:
         """检查是否过期"""
@@ -348,6 +349,7 @@ class QRLoginManager:
                                 .get("iframeRedirectUrl")
                             )
                             session.verification_url = iframe_url
+                            session.event.set()
                             logger.warning(f"账号被风控，需要手机验证: {session_id}, URL: {iframe_url}")
                             break
                         else:
@@ -360,6 +362,7 @@ class QRLoginManager:
                                 if k == 'unb':
                                     session.unb = v
 
+                            session.event.set()
                             logger.info(f"扫码登录成功: {session_id}, UNB: {session.unb}")
                             break
 
@@ -370,6 +373,7 @@ class QRLoginManager:
                     elif qrcode_status == "EXPIRED":
                         # 二维码已过期
                         session.status = 'expired'
+                        session.event.set()
                         logger.info(f"二维码已过期: {session_id}")
                         break
 
@@ -381,6 +385,7 @@ class QRLoginManager:
                     else:
                         # 用户取消确认
                         session.status = 'cancelled'
+                        session.event.set()
                         logger.info(f"用户取消登录: {session_id}")
                         break
 
@@ -393,12 +398,14 @@ class QRLoginManager:
             # 超时处理
             if session.status not in ['success', 'expired', 'cancelled', 'verification_required']:
                 session.status = 'expired'
+                session.event.set()
                 logger.info(f"二维码监控超时，标记为过期: {session_id}")
 
         except Exception as e:
             logger.error(f"监控二维码状态失败: {e}")
             if session_id in self.sessions:
                 self.sessions[session_id].status = 'expired'
+                self.sessions[session_id].event.set()
     
     def get_session_status(self, session_id: str) -> Dict[str, Any]:
         """获取会话状态"""
@@ -408,6 +415,7 @@ class QRLoginManager:
 
         if session.is_expired() and session.status != 'success':
             session.status = 'expired'
+            session.event.set()
 
         result = {
             'status': session.status,